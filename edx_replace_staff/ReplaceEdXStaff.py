@@ -4,21 +4,18 @@
 import os
 import csv
 import sys
-import time
 import logging
 import datetime
 import argparse
-import traceback
 from getpass import getpass
-from selenium import webdriver
-from selenium.webdriver.remote.webdriver import WebDriver
-from selenium.webdriver.common.action_chains import ActionChains
-from selenium.webdriver.common.by import By
-from selenium.webdriver.chrome.options import Options as ChromeOptions
-from selenium.webdriver.firefox.options import Options as FirefoxOptions
-from selenium.webdriver.support.wait import WebDriverWait
-from selenium.common import exceptions as selenium_exceptions
-from selenium.webdriver.support import expected_conditions as EC
+from edx_replace_staff.scheduler import action_columns, splitEmails, parseDeadline
+from edx_replace_staff.api import StaffingSession, getCredentials
+from edx_replace_staff.access_cache import AccessCache, default_ttl_days
+
+# Nothing from Selenium gets imported up here. The browser code lives in
+# edx_replace_staff.browser and is only loaded once we need a browser,
+# so that --help and --validate stay fast. The actual work is done by
+# edx_replace_staff.api; this file is just the command line around it.
 
 # TODO: Better tracking of what we had to skip.
 
@@ -34,10 +31,23 @@ Add - the e-mail addresses of the staff to be added. (not usernames)
 Promote - promote these people to Admin status
 Remove - just like "Add"
 Demote - removes Admin status
+Deadline - when this row's changes need to be done by, like 2024-05-01 17:00
+           (optional)
+
+Rows are worked on most urgent first: rows with removals, then demotions,
+then promotions, then additions. Within each of those, rows with the
+earliest deadline go first, and rows without one come last.
+
+The output is a CSV file (remaining_courses.csv) that shows which courses
+couldn't be accessed, plus staffing_results.csv, which shows how each change
+went: done, unchanged (already that way), no_user, not_in_course, or failed.
+If the --list option is used, the CSV instead shows who's admin and staff
+in all courses.
 
-The output is another CSV file that shows which courses couldn't be accessed
-and which people couldn't be removed. If the --list option is used,
-the CSV instead shows who's admin and staff in all courses.
+Courses that were forbidden, where you weren't admin, that use the old URL
+scheme, or that timed out are noted in course_access_cache.json. Later runs
+send those straight to remaining_courses.csv without opening them, until
+the note expires or you use --recheck.
 
 Options:
   -h or --help:     Print this message and exit.
@@ -46,23 +56,47 @@ Options:
   -c or --chrome:   Use Chrome instead of default Firefox.
   -v or --visible:  Run the browser in normal mode instead of headless.
   --cs50:           Include CS50 courses. By default, they are skipped.
+  --validate:       Check the CSV file for problems and exit. No browser.
+  --remote URL:     Use a Selenium Grid or standalone server at URL instead of
+                    a local browser. Can also be set with SELENIUM_REMOTE_URL.
+  --sessions N:     Run N browser sessions side by side. Default is 1.
+  --recheck:        Visit every course, even ones we couldn't work on last
+                    time. Normally those are skipped for a while (see below).
+  --cache-ttl DAYS: How long to remember courses we couldn't work on.
+                    Default is 7 days (1 day for page timeouts).
+  --profile:        Record memory use and page-load times for every course in
+                    profile_timeline.csv, and swap in a fresh browser
+                    (reusing the login) when one gets too big or too slow.
+  --recycle-pages N:      With --profile, fresh browser after N courses.
+                          Default is 250. 0 turns this off.
+  --recycle-mb MB:        With --profile, fresh browser once it uses this
+                          much memory. Default is 2048. 0 turns this off.
+  --recycle-slowdown X:   With --profile, fresh browser once pages load X
+                          times slower than at first. Default is 3.
+                          0 turns this off.
+  --reconcile SNAPSHOT:
+                    Treat the csv file as a roster of who should be admin
+                    and staff where (Course, URL, Admin, Staff columns, or
+                    Course, URL, Email, Role), compare it with SNAPSHOT
+                    (a course_staffing.csv from --list), and write the
+                    changes needed to reconcile_actions.csv. No browser.
+  --apply:          With --reconcile, go ahead and make those changes.
+                    The account you sign in with is never removed or
+                    demoted, here or in reconcile_actions.csv.
+  --keep EMAILS:    With --reconcile, never remove or demote these people.
+                    Space- or comma-separated.
+  --serve SOCKET:   Don't process a file. Instead, keep signed-in browsers
+                    running and take jobs on the Unix socket SOCKET.
+  --submit SOCKET:  Send the file to a server started with --serve, and
+                    print the results as they come in.
+  --credentials F:  Read the edX username and password from JSON file F
+                    ({"username": ..., "password": ...}) instead of asking.
+                    EDX_CREDENTIALS_FILE, or EDX_USERNAME and EDX_PASSWORD,
+                    work too.
 
 """
 
-# Prep the logger
-logger = logging.getLogger(__name__)
-logger.setLevel(logging.INFO)
-formatter = logging.Formatter(
-    "%(asctime)s : %(funcName)s : %(levelname)s : %(message)s"
-)
-
-file_handler = logging.FileHandler("edx_staffing.log")
-file_handler.setFormatter(formatter)
-logger.addHandler(file_handler)
-
-screen_handler = logging.StreamHandler()
-screen_handler.setFormatter(formatter)
-logger.addHandler(screen_handler)
+logger = logging.getLogger("edx_replace_staff")
 
 
 def trimLog(log_file="edx_staffing.log", max_lines=20000) -> None:
@@ -78,486 +112,185 @@ def trimLog(log_file="edx_staffing.log", max_lines=20000) -> None:
 
     """
 
+    if not os.path.exists(log_file):
+        return
+
     with open(log_file, "r") as f:
         lines = f.readlines()
     with open(log_file, "w") as f:
         f.writelines(lines[-max_lines:])
 
 
-# Instantiating a headless Chrome or Firefox browser
-def setUpWebdriver(run_headless: bool, driver_choice: str = "firefox") -> WebDriver:
+def setUpLogging(log_file="edx_staffing.log") -> None:
     """
-    Sets up a Chrome or Firefox browser.
-
-    Parameters:
-    run_headless (bool): Whether to run the browser in headless mode.
-    driver_choice (str): Which browser to use. Default is firefox, "chrome" is an option.
+    Sends log messages to the screen and to a log file.
+    Only done once we know we're going to do real work.
     """
-    logger.info("Setting up webdriver.")
-    os.environ["PATH"] = os.environ["PATH"] + os.pathsep + os.path.dirname(__file__)
-
-    # Check to make sure the repo is in the right place. If not, prompt for it.
-    repo_path = "/Users/" + os.getlogin() + "/Documents/GitHub/edx_replace_staff/"
-    if not os.path.exists(repo_path):
-        prompt = (
-            "The edx_replace_staff repo is not in its usual location.\n"
-            + "Please enter the full path to the repo, starting from your root directory: "
-        )
-        repo_path = input(prompt)
-        if not os.path.exists(repo_path):
-            sys.exit("Cannot proceed. The path you entered does not exist.")
-
-    if driver_choice == "chrome":
-        op = ChromeOptions()
-        op.add_argument("start-maximized")
-        op.timeouts = {"implicit": 1000}
-        if run_headless:
-            op.add_argument("--headless")
-        webdriver.ChromeService(
-            executable_path=os.path.join(repo_path, "edx_replace_staff/chromedriver")
-        )
-        driver = webdriver.Chrome(options=op)
-    else:
-        op = FirefoxOptions()
-        op.binary_location = "/Applications/Firefox.app/Contents/MacOS/firefox"
-        op.timeouts = {"implicit": 1000}
-        if run_headless:
-            op.add_argument("-headless")
-        webdriver.FirefoxService(
-            executable_path=os.path.join(repo_path, "edx_replace_staff/geckodriver")
-        )
-        driver = webdriver.Firefox(options=op)
-
-    return driver
-
-
-def signIn(driver: WebDriver, username: str, password: str) -> None:
-    """Signs into edx.org"""
-    # Locations
-    login_page = "https://authn.edx.org/login"
-    username_input_css = "#emailOrUsername"
-    password_input_css = "#password"
-    login_button_css = "#sign-in"
-
-    # Open the edX sign-in page
-    logger.info("Logging in...")
-    driver.get(login_page)
+    if logger.handlers:
+        return
 
-    # Wait a second.
-    time.sleep(1)
+    trimLog(log_file)
 
-    # Apparently we have to run this more than once sometimes.
-    login_count = 0
-    while login_count < 3:
-        # Sign in
-        try:
-            WebDriverWait(driver, 10).until(
-                EC.presence_of_element_located((By.CSS_SELECTOR, username_input_css))
-            )
-        except selenium_exceptions.TimeoutException:
-            driver.quit()
-            sys.exit("Timed out waiting for username field.")
-
-        # Wait a second.
-        time.sleep(1)
-
-        username_field = driver.find_elements(By.CSS_SELECTOR, username_input_css)[0]
-        username_field.clear()
-        username_field.send_keys(username)
-        logger.info("Username sent")
-
-        # Wait a second.
-        time.sleep(1)
-
-        password_field = driver.find_elements(By.CSS_SELECTOR, password_input_css)[0]
-        password_field.clear()
-        password_field.send_keys(password)
-        logger.info("Password sent")
-
-        # Wait a second.
-        time.sleep(1)
-
-        # Using ActionChains is necessary because edX put a div over the login button.
-        login_button = driver.find_elements(By.CSS_SELECTOR, login_button_css)[0]
-        actions = ActionChains(driver)
-        actions.move_to_element(login_button).click().perform()
-        logger.info("Login button clicked")
-
-        # Check to make sure we're signed in.
-        # There are several possible fail states to check for.
-        found_dashboard = False
-        try:
-            logger.info("Finding dashboard...")
-            found_dashboard = WebDriverWait(driver, 10).until(EC.url_contains("home"))
-        except (
-            selenium_exceptions.TimeoutException,
-            selenium_exceptions.InvalidSessionIdException,
-        ):
-            logger.debug(str(traceback.print_exc()), "WARNING")
-            login_fail = driver.find_elements(By.CSS_SELECTOR, "#login-failure-alert")
-            if len(login_fail) > 0:
-                logger.info("Incorrect login or password")
-            need_reset = driver.find_elements(
-                By.CSS_SELECTOR, "#password-security-reset-password"
-            )
-            if len(need_reset) > 0:
-                logger.error("Password reset required")
-            if "Forbidden" in driver.title:
-                logger.error("403: Forbidden")
-
-        # If we're logged in, we're done.
-        if found_dashboard:
-            logger.info("Logged in.")
-            return
-
-        login_count += 1
-        logger.info("Login attempt count: " + str(login_count))
-
-    driver.close()
-    logger.error("Login failed.")
-    sys.exit("Login issue or course dashboard page timed out.")
-
-
-def userIsPresent(driver: WebDriver, email: str) -> bool:
-    """Checks to see if user is already on course team. Returns boolean."""
-    logger.debug("Is " + email + " present?")
-
-    is_staff_xpath = "//a[contains(@href,'" + email.lower() + "')]"
-    user_present = driver.find_elements(By.XPATH, is_staff_xpath)
-    if len(user_present) > 0:
-        logger.debug(email + " is on the course team.")
-        return True
-    else:
-        logger.debug(email + " is not on the course team.")
-        return False
-
-
-def userIsStaff(driver: WebDriver, email: str) -> bool:
-    """Checks to see if user is staff. Returns boolean."""
-    staff_user_xpath = (
-        "//span[contains(@class, 'badge-current-user') and contains(text(), 'Staff')]"
-        + "//following-sibling::a[contains(@href, '"
-        + email.lower()
-        + "')]"
+    logger.setLevel(logging.INFO)
+    formatter = logging.Formatter(
+        "%(asctime)s : %(funcName)s : %(levelname)s : %(message)s"
     )
-    staff_flag = driver.find_elements(By.XPATH, staff_user_xpath)
-    if len(staff_flag) > 0:
-        logger.debug(email + " is staff.")
-        return True
-    else:
-        logger.debug(email + " is not staff.")
-        return False
-
 
-def userIsAdmin(driver: WebDriver, email: str) -> bool:
-    """
-    Checks to see whether the user we're signed in as is admin.
-    If not, we can't do anything - you need to be admin to make changes.
-    Returns boolean.
-    """
+    file_handler = logging.FileHandler(log_file)
+    file_handler.setFormatter(formatter)
+    logger.addHandler(file_handler)
 
-    # Xpath to find the admin flag for this user.
-    is_admin_xpath = (
-        "//span[contains(@class, 'badge-current-user') and contains(text(), 'Admin')]"
-        + "//following-sibling::a[contains(@href, '"
-        + email.lower()
-        + "')]"
-    )
-
-    admin_flag = driver.find_elements(By.XPATH, is_admin_xpath)
-    if len(admin_flag) > 0:
-        logger.debug(email + " is admin.")
-        return True
-    else:
-        logger.debug(email + " is not admin.")
-        return False
+    screen_handler = logging.StreamHandler()
+    screen_handler.setFormatter(formatter)
+    logger.addHandler(screen_handler)
 
 
-def getAllUsers(driver: WebDriver) -> dict:
+def validateCSV(filename: str, list_only: bool = False) -> list[str]:
     """
-    Returns a dictionary with two lists of e-mail addresses: staff and admin.
-    """
-
-    staff_xpath = "//span[contains(@class, 'badge-current-user') and contains(text(), 'Staff')]/following-sibling::a"
-    admin_xpath = "//span[contains(@class, 'badge-current-user') and contains(text(), 'Admin')]/following-sibling::a"
-
-    all_staff = driver.find_elements(By.XPATH, staff_xpath)
-    all_admins = driver.find_elements(By.XPATH, admin_xpath)
-    staff_list = [x.text for x in all_staff]
-    admin_list = [y.text for y in all_admins]
-
-    return {"staff": staff_list, "admin": admin_list}
-
+    Checks the input CSV for problems without opening a browser.
 
-def closeErrorDialog(driver: WebDriver) -> dict:
-    """
-    Closes error dialogs on the course staff page. Can't go on without that.
+    Parameters:
+    filename (str): The CSV file to check.
+    list_only (bool): Whether we only need the URL column.
 
-    Returns info about the dialog.
-        If there was none, it's "no_dialog"
-        If we closed it and they weren't a user, it's "no_user"
-        If we couldn't close the dialog, it's "failed_to_close"
+    Returns:
+    A list of problems found. Empty if everything looks fine.
     """
+    problems = []
 
-    # Try to find the "ok" button for the error dialogs.
-    wrong_email_css = "div[aria-label='Error adding user'] button"
-
-    # If there is an error dialog open, report why, clear it, and move on.
-    try:
-        logger.debug("Checking for error dialog")
-        wrong_email_ok_button = WebDriverWait(driver, 5).until(
-            EC.presence_of_element_located((By.CSS_SELECTOR, wrong_email_css))
-        )
-        if wrong_email_ok_button is None:
-            logger.debug("No error dialog found.")
-            return {"reason": "no_dialog"}
-        else:
-            logger.debug("Error dialog found.")
-    except Exception:
-        # If there was no error dialog, we can move on.
-        logger.debug("No error dialog found.")
-        return {"reason": "no_dialog"}
+    with open(filename, "r", newline="") as file:
+        reader = csv.DictReader(file)
+        headers = reader.fieldnames or []
 
-    try:
-        # No user with specified e-mail address.
-        # (At least, that's the only current error shown.)
-        wrong_email_ok_button.click()
-        return {"reason": "no_user"}
-    except Exception as e:
-        # Couldn't close the error dialog.
-        logger.warning("Could not close error dialog for " + driver.title)
-        logger.debug(str(e))
-        return {"reason": "failed_to_close"}
-
-
-def addStaff(driver: WebDriver, email_list: list[str]) -> None:
-    """Adds a list of users as course staff via e-mail address. You can promote them to admin later."""
-
-    # Locations for add-staff inputs
-    new_team_xpath = "//button[text()='New team member']"
-    new_staff_email_xpath = "//input[@name='email']"
-    add_user_xpath = "//button[text()='Add user']"
-
-    logger.info("Adding staff to " + driver.title)
-
-    # For each address:
-    for email in email_list:
-        logger.info("Adding " + email)
-
-        # If the user is already present, move to the next e-mail address.
-        if userIsPresent(driver, email):
-            logger.debug(email + " is already on course team.")
-            continue
-        else:
-            logger.debug(email + " is not on course team yet.")
-
-        # Retry up to 3 times.
-        success = False
-        for x in range(0, 3):
-            try:
-                # Click the "New Team Member" button
-                new_team_buttons = driver.find_elements(By.XPATH, new_team_xpath)
-                new_team_buttons[0].click()
-                logger.debug("Clicked 'New Team Member'")
-            except Exception:
-                # If that failed, there could be an error message up. Try to close it.
-                closeErrorDialog(driver)
+        needed = ["URL"] if list_only else ["URL"] + action_columns
+        missing = [h for h in needed if h not in headers]
+        if len(missing) > 0:
+            problems.append("Missing column(s): " + ", ".join(missing))
+            return problems
 
+        # Line 1 is the header.
+        for line_number, row in enumerate(reader, start=2):
+            if row["URL"] is None or row["URL"].strip() == "":
+                continue
+            if None in row.values():
+                problems.append(
+                    "Line " + str(line_number) + ": too few columns."
+                )
+                continue
+            if list_only:
+                continue
             try:
-                # Put the e-mail into the input box.
-                email_boxes = driver.find_elements(By.XPATH, new_staff_email_xpath)
-                email_boxes[0].clear()
-                email_boxes[0].send_keys(email)
-                # Click "Add User"
-                add_user_buttons = driver.find_elements(By.XPATH, add_user_xpath)
-                add_user_buttons[0].click()
-
-                # Now that we've clicked the add button,
-                # Either the user was added or there's an error dialog.
-                if userIsPresent(driver, email):
-                    # All good.
-                    success = True
-                    break
-                else:
-                    # Clear the dialog and try again (or move on).
-                    closeErrorDialog(driver)
-
-            except Exception:
-                # If the stuff above failed, it's probably because
-                # one of the elements hasn't been added to the page yet.
-                logger.warning("Couldn't add " + email + ", trying again...")
-                # logger.debug(repr(e))
-
-        if success:
-            logger.info("Successfully added " + email)
-        else:
-            logger.info("Could not add " + email)
-            closeErrorDialog(driver)
-
-    return
-
+                parseDeadline(row.get("Deadline"))
+            except ValueError:
+                problems.append(
+                    "Line "
+                    + str(line_number)
+                    + ": can't read deadline: "
+                    + row["Deadline"]
+                )
+            for column in action_columns:
+                for email in splitEmails(row[column]):
+                    if "@" not in email:
+                        problems.append(
+                            "Line "
+                            + str(line_number)
+                            + ", "
+                            + column
+                            + ": not an e-mail address: "
+                            + email
+                        )
 
-def promoteStaff(driver: WebDriver, email_list: list[str]) -> None:
-    """Promotes a list of staff users to admin."""
+    return problems
 
-    # For each address:
-    for email in email_list:
-        logger.info("Promoting " + email)
 
-        success = False
+def askForCredentials() -> tuple[str, str]:
+    """Asks for the edX username and password on the command line."""
+    print(
+        """
+This script requires a username and password to run.
+This user must have Admin status on all courses in which
+the script is to run. Press control-C to cancel.
+"""
+    )
+    username = input("User e-mail address: ")
+    password = getpass()
+    return (username, password)
 
-        # Find the "Add admin access" button for this user.
-        promotion_xpath = (
-            "//a[contains(@href, '"
-            + email.lower()
-            + "')]/ancestor::div[contains(@class, 'member-info')]"
-            + "//following-sibling::div[contains(@class, 'member-actions')]"
-            + "//button[contains(text(), 'Add admin access')]"
-        )
 
-        if userIsStaff(driver, email):
-            # Keep trying up to 3 times in case we're still loading.
-            for x in range(0, 3):
-                try:
-                    # Find the promotion button for this user.
-                    promotion_button = driver.find_elements(By.XPATH, promotion_xpath)
-                except Exception:
-                    logger.warning(
-                        "No promotion button found. You may not have Admin access. Trying again..."
-                    )
-                    continue
-                try:
-                    promotion_button[0].click()
-                    success = True
-                    break
-                except Exception:
-                    logger.debug("Couldn't click promotion button. Trying again...")
-        else:
-            if userIsAdmin(driver, email):
-                logger.debug(email + " is already admin.")
-            else:
-                logger.debug(
-                    email + " is not in this course. Add them before promoting them."
-                )
+def submitCSV(socket_path: str, csvfile: str, list_only: bool = False) -> None:
+    """Sends a CSV to a server started with --serve and prints what comes back."""
+    from edx_replace_staff.daemon import submitJob
 
-        if success:
-            logger.info("Promoted " + email + " to Admin.")
+    with open(csvfile, "r") as file:
+        if list_only:
+            request = {"list": [r["URL"] for r in csv.DictReader(file) if r["URL"]]}
         else:
-            logger.info("Could not promote " + email)
-
-    return
-
+            request = {"csv": file.read()}
 
-def removeStaff(driver: WebDriver, email_list: list[str]) -> None:
+    try:
+        for message in submitJob(socket_path, request):
+            if "error" in message:
+                sys.exit("Error: " + message["error"])
+            elif "queued" in message:
+                print(
+                    "Queued as job "
+                    + str(message["queued"])
+                    + ", with "
+                    + str(message["position"])
+                    + " job(s) ahead of it."
+                )
+            elif "done" in message:
+                totals = ", ".join(k + ": " + str(v) for k, v in message["totals"].items())
+                print("Done. " + totals)
+            elif list_only:
+                print(
+                    message["url"]
+                    + " ("
+                    + message["status"]
+                    + ")\n  Admin: "
+                    + " ".join(message.get("admin", []))
+                    + "\n  Staff: "
+                    + " ".join(message.get("staff", []))
+                )
+            else:
+                print(message["url"] + " (" + message["status"] + ")")
+                for result in message["results"]:
+                    print("  " + " ".join([result["Action"], result["Email"], result["Result"]]))
+    except OSError as e:
+        sys.exit("Could not reach the server at " + socket_path + ": " + str(e))
+
+
+# The browser functions that used to live in this module. Older scripts
+# still import them from here.
+browser_names = [
+    "setUpWebdriver",
+    "signIn",
+    "userIsPresent",
+    "userIsStaff",
+    "userIsAdmin",
+    "getAllUsers",
+    "closeErrorDialog",
+    "addStaff",
+    "promoteStaff",
+    "removeStaff",
+    "demoteStaff",
+]
+
+
+def __getattr__(name: str):
     """
-    Removes a list of users from the course staff.
-    If they're admin you have to demote them first.
+    Hands over the old browser functions (signIn, addStaff, etc.) without
+    loading Selenium until somebody actually asks for one. Any other name
+    is just missing, so things like hasattr() don't load Selenium either.
     """
-
-    logger.info("Removing staff from " + driver.title)
-
-    confirm_removal_xpath = "//div[contains(@aria-label, 'Delete course team member')]//button[text()='Delete']"
-
-    # For each address:
-    for email in email_list:
-        logger.debug("Removing " + email)
-
-        # If this user isn't present, move on to the next one.
-        if not userIsPresent(driver, email):
-            logger.debug(email + " was already not in this course.")
-            continue
-
-        # Find the delete button for this user.
-        removal_xpath = (
-            "//div[contains(@class, 'course-team-member')]"
-            + "//div[contains(@class, 'member-info')]"
-            + "//a[text()='"
-            + email.lower()
-            + "']"
-            + "/ancestor::div[contains(@class, 'course-team-member')]"
-            + "//div[contains(@class, 'member-actions')]"
-            + "//button[@data-testid='delete-button']"
+    if name not in browser_names:
+        raise AttributeError(
+            "module " + repr(__name__) + " has no attribute " + repr(name)
         )
 
-        success = False
+    from edx_replace_staff import browser
 
-        for x in range(0, 3):
-            try:
-                # E-mail addresses in the data attribute are lowercased.
-                remove_button = driver.find_elements(By.XPATH, removal_xpath)
-                # Click the trash can ("remove user" button)
-                remove_button[0].click()
-                # Click the "confirm" button.
-                logger.debug("Trying to remove " + email)
-                confirm_button = WebDriverWait(driver, 5).until(
-                    EC.presence_of_element_located((By.XPATH, confirm_removal_xpath))
-                )
-                confirm_button.click()
-                success = True
-                break
-
-            except Exception:
-                # logger.debug(repr(e))
-                # Keep trying up to 3 times.
-                logger.debug("Trying again...")
-
-        if success:
-            logger.info("Removed " + email)
-        else:
-            logger.info("Could not remove " + email)
-
-    return
-
-
-def demoteStaff(driver: WebDriver, email_list: list[str]) -> None:
-    """Demotes a list of admin users to staff."""
-
-    logger.info("Demoting staff in " + driver.title)
-
-    # For each address:
-    for email in email_list:
-        logger.debug("Demoting " + email)
-
-        success = False
-
-        # Find the delete button for this user.
-        demotion_xpath = (
-            "//a[contains(@href, '"
-            + email.lower()
-            + "')]/ancestor::div[contains(@class, 'member-info')]"
-            + "//following-sibling::div[contains(@class, 'member-actions')]"
-            + "//button[contains(text(), 'Remove admin access')]"
-        )
-
-        if userIsAdmin(driver, email):
-            # Keep trying up to 3 times in case we're still loading.
-            for x in range(0, 3):
-                try:
-                    # Find the demotion button for this user.
-                    demotion_button = driver.find_elements(By.XPATH, demotion_xpath)
-                except Exception:
-                    logger.warning(
-                        "Couldn't find demotion button. You may not have Admin access. Trying again..."
-                    )
-                    continue
-                try:
-                    demotion_button[0].click()
-                    success = True
-                    break
-                except Exception:
-                    logger.debug("Couldn't click demotion button. Trying again...")
-        else:
-            if userIsStaff(driver, email):
-                logger.debug(email + " is already staff.")
-            else:
-                logger.debug(email + " is not in this course.")
-
-        if success:
-            logger.info("Demoted " + email + " to staff.")
-        else:
-            logger.info("Could not demote " + email)
-
-    return
+    return getattr(browser, name)
 
 
 #######################
@@ -566,14 +299,11 @@ def demoteStaff(driver: WebDriver, email_list: list[str]) -> None:
 
 
 def ReplaceEdXStaff():
-    trimLog()
-
-    num_classes = 0
     skipped_classes = []
     staffed_classes = []
+    finished_classes = []
+    action_results = []
     run_headless = True
-    timeouts = 0
-    too_many_timeouts = 3
 
     # Read in command line arguments.
     parser = argparse.ArgumentParser(usage=instructions, add_help=False)
@@ -583,12 +313,87 @@ def ReplaceEdXStaff():
     parser.add_argument("-f", "--firefox", action="store_true")
     parser.add_argument("-c", "--chrome", action="store_true")
     parser.add_argument("--cs50", action="store_true")
-    parser.add_argument("csvfile", default=None)
+    parser.add_argument("--validate", action="store_true")
+    parser.add_argument("--remote", default=os.environ.get("SELENIUM_REMOTE_URL"))
+    parser.add_argument("--sessions", type=int, default=1)
+    parser.add_argument("--credentials", default=None)
+    parser.add_argument("--recheck", action="store_true")
+    parser.add_argument("--cache-ttl", type=float, default=default_ttl_days)
+    parser.add_argument("--profile", action="store_true")
+    parser.add_argument("--recycle-pages", type=int, default=250)
+    parser.add_argument("--recycle-mb", type=float, default=2048)
+    parser.add_argument("--recycle-slowdown", type=float, default=3.0)
+    parser.add_argument("--serve", metavar="SOCKET", default=None)
+    parser.add_argument("--submit", metavar="SOCKET", default=None)
+    parser.add_argument("--reconcile", metavar="SNAPSHOT", default=None)
+    parser.add_argument("--apply", action="store_true")
+    parser.add_argument("--keep", default="")
+    parser.add_argument("csvfile", nargs="?", default=None)
 
     args = parser.parse_args()
-    if args.help or args.csvfile is None:
+    if args.help or (args.csvfile is None and args.serve is None):
         sys.exit(instructions)
 
+    if args.reconcile is not None:
+        # Work out the changes from a roster and a snapshot. No browser needed.
+        from edx_replace_staff import reconcile
+
+        keep = set(splitEmails(args.keep.replace(",", " ")))
+
+        # Read both files first, so a typo doesn't wait until after the password.
+        try:
+            desired = reconcile.readStaffing(args.csvfile)
+            current = reconcile.readStaffing(args.reconcile)
+        except (OSError, ValueError) as e:
+            sys.exit(str(e))
+
+        # Never take away our own access, whatever the roster says. Find out
+        # who we'll sign in as before working out the changes, so the file
+        # we write matches what --apply does. A server started with --serve
+        # signs in on its own, so there's no point asking when submitting.
+        try:
+            credentials = getCredentials(args.credentials)
+        except ValueError as e:
+            sys.exit(str(e))
+        if credentials is None and args.apply and args.submit is None:
+            credentials = askForCredentials()
+        if credentials is not None:
+            keep.add(credentials[0])
+        else:
+            print(
+                "No stored login, so the account you'll run these changes with"
+                " isn't protected. Add it with --keep, or use --credentials."
+            )
+
+        reconciled_rows = reconcile.reconcile(desired, current, keep)
+        reconcile.writeActions(reconciled_rows)
+        print(reconcile.summarize(reconciled_rows))
+        print("See " + reconcile.reconcile_file + " for the full list.")
+        if not args.apply or len(reconciled_rows) == 0:
+            return
+    elif args.serve is None:
+        if not os.path.exists(args.csvfile):
+            sys.exit("Input file not found: " + args.csvfile)
+
+        # Check the file before we bother with passwords and browsers.
+        problems = validateCSV(args.csvfile, args.list)
+        if len(problems) > 0:
+            sys.exit("Problems with " + args.csvfile + ":\n" + "\n".join(problems))
+        if args.validate:
+            print(args.csvfile + " looks good.")
+            return
+
+    # Hand the file to a running server instead of doing it ourselves.
+    if args.submit is not None:
+        if args.reconcile is not None:
+            # Send the changes we just worked out, not the roster.
+            submitCSV(args.submit, reconcile.reconcile_file)
+        else:
+            submitCSV(args.submit, args.csvfile, args.list)
+        return
+
+    setUpLogging()
+
     run_headless = True
     if args.visible:
         run_headless = False
@@ -598,184 +403,170 @@ def ReplaceEdXStaff():
         logger.info("Using Chrome instead of Firefox.")
         driver_choice = "chrome"
 
-    if not os.path.exists(args.csvfile):
-        sys.exit("Input file not found: " + args.csvfile)
-
-    # Prompt for username and password
-    # TODO: Maybe allow a file to read username and pw from.
-    print(
-        """
-This script requires a username and password to run.
-This user must have Admin status on all courses in which
-the script is to run. Press control-C to cancel.
-"""
-    )
-    username = input("User e-mail address: ")
-    password = getpass()
+    # Use stored credentials if there are any. Otherwise, ask.
+    # (--reconcile already sorted this out.)
+    if args.reconcile is None:
+        try:
+            credentials = getCredentials(args.credentials)
+        except ValueError as e:
+            sys.exit(str(e))
+        if credentials is None:
+            credentials = askForCredentials()
+    username, password = credentials
+
+    profiler = None
+    if args.profile:
+        from edx_replace_staff.profiler import ResourceProfiler
+
+        profiler = ResourceProfiler(
+            max_pages=args.recycle_pages,
+            max_browser_mb=args.recycle_mb,
+            max_slowdown=args.recycle_slowdown,
+        )
+        logger.info("Profiling. See profile_timeline.csv.")
+
+    if args.serve is not None:
+        from edx_replace_staff.daemon import serve
+
+        session = StaffingSession(
+            username,
+            password,
+            sessions=args.sessions,
+            run_headless=run_headless,
+            driver_choice=driver_choice,
+            remote_url=args.remote,
+            include_cs50=args.cs50,
+            access_cache=AccessCache(ttl_days=args.cache_ttl),
+            recheck=args.recheck,
+            profiler=profiler,
+        )
+        try:
+            serve(session, args.serve)
+        except RuntimeError as e:
+            session.close()
+            sys.exit(str(e))
+        return
 
     start_time = datetime.datetime.now()
 
-    # Prep the web driver and sign into edX.
-    driver = setUpWebdriver(run_headless, driver_choice)
-    signIn(driver, username, password)
-
-    # We have to open the Studio outline in order to avoid CORS issues for some reason.
-    driver.get("https://studio.edx.org/home")
-    # This redirects to https://course-authoring.edx.org/home , but we actually want to get the redirect!
-    # When the input with id pgn-searchfield-input-1 shows up we're good to continue.
+    if args.reconcile is not None:
+        rows = reconciled_rows
+        has_deadlines = False
+    else:
+        # Open the csv and read it to a set of dicts
+        with open(args.csvfile, "r") as file:
+            logger.info("Opening csv file.")
+            reader = csv.DictReader(file)
+            has_deadlines = "Deadline" in (reader.fieldnames or [])
+            rows = list(reader)
+
+    session = StaffingSession(
+        username,
+        password,
+        sessions=args.sessions,
+        run_headless=run_headless,
+        driver_choice=driver_choice,
+        remote_url=args.remote,
+        include_cs50=args.cs50,
+        access_cache=AccessCache(ttl_days=args.cache_ttl),
+        recheck=args.recheck,
+        profiler=profiler,
+    )
     try:
-        WebDriverWait(driver, 10).until(
-            EC.presence_of_element_located((By.ID, "pgn-searchfield-input-1"))
-        )
-    except selenium_exceptions.TimeoutException:
-        logger.error("Studio page load timed out.")
-        driver.quit()
-        sys.exit("Studio page load timed out.")
-
-    # Open the csv and read it to a set of dicts
-    with open(args.csvfile, "r") as file:
-        logger.info("Opening csv file.")
-        reader = csv.DictReader(file)
-
-        # For each line in the CSV...
-        for each_row in reader:
-            # logger.debug("Processing line:")
-            # logger.debug(each_row)
-
-            if each_row["URL"] == "":
-                continue
-
-            # Skip CS50 courses unless we've specifically asked to include them.
-            if "cs50" in each_row["URL"].lower() and not args.cs50:
-                logger.info("Skipping CS50 course " + each_row["URL"])
-                skipped_classes.append(each_row)
-                continue
-
-            # Skip pre-2015 URL patterns that will no longer work.
-            # The newer one has a + instead of a /
-            if "HarvardX/" in each_row["URL"]:
-                logger.info("Skipping course with old URL scheme: " + each_row["URL"])
-                skipped_classes.append(each_row)
-                continue
-
-            driver.get(each_row["URL"].strip())
-            num_classes += 1
-
-            # Check to make sure we've opened a new page.
-            # The e-mail input box should be invisible.
-            try:
-                WebDriverWait(driver, 10).until(
-                    EC.invisibility_of_element_located(
-                        (By.CSS_SELECTOR, "input#user-email-input")
-                    )
-                )
-                timeouts = 0
-            except Exception:
-                # logger.debug(repr(e))
-                # If we can't open the URL, make a note and skip this course.
-                skipped_classes.append(each_row)
-                if "Dashboard" in driver.title:
-                    logger.warning(
-                        "Course Team page load timed out for " + each_row["URL"]
-                    )
-                    skipped_classes.append(each_row)
-                    timeouts += 1
-                    if timeouts >= too_many_timeouts:
-                        logger.warning(
-                            str(too_many_timeouts) + " course pages timed out in a row."
-                        )
-                        logger.warning(
-                            "Check URLs and internet connectivity and try again."
-                        )
-                        break
-                continue
-
-            # If we only need to get users and status, we can do that easier.
-            if args.list:
-                logger.info("Getting staff for " + each_row["URL"])
-                user_list = getAllUsers(driver)
-                # logger.debug(user_list)
-                this_class = {
-                    "Course": each_row["Course"],
+        outcomes = session.runRows(rows, args.list)
+    except RuntimeError as e:
+        sys.exit(str(e))
+    finally:
+        # Done with the webdrivers.
+        session.close()
+
+    for each_row, outcome in outcomes:
+        if outcome["status"] == "listed":
+            finished_classes.append(each_row)
+            staffed_classes.append(
+                {
+                    "Course": each_row.get("Course", ""),
                     "URL": each_row["URL"],
-                    "Admin": " ".join(user_list["admin"]),
-                    "Staff": " ".join(user_list["staff"]),
+                    "Admin": " ".join(outcome["users"]["admin"]),
+                    "Staff": " ".join(outcome["users"]["staff"]),
                 }
-                staffed_classes.append(this_class)
-                continue
-
-            # Check to make sure we have the ability to change user status.
-            if not userIsAdmin(driver, username.lower()):
-                logger.warning("\nUser is not admin in " + each_row["URL"])
-                skipped_classes.append(each_row)
-                continue
+            )
+        elif outcome["status"] == "done":
+            finished_classes.append(each_row)
+            for action in outcome["actions"]:
+                action_results.append(
+                    {"Course": each_row.get("Course", ""), "URL": each_row["URL"]}
+                    | action
+                )
+        else:
+            # If we couldn't open the course, make a note of it.
+            skipped_classes.append(each_row)
 
-            if "Course team" not in driver.title or "Forbidden" in driver.title:
-                logger.warning("\nCould not open course " + each_row["URL"])
-                skipped_classes.append(each_row)
-                continue
+    # In list mode, save a CSV with our course staff.
+    if args.list:
+        logger.info(
+            "See course_staffing.csv for a full list of course staff and administrators."
+        )
+        with open("course_staffing.csv", "w", newline="") as all_staff:
+            fieldnames = ["Course", "URL", "Admin", "Staff"]
+            writer = csv.DictWriter(all_staff, fieldnames=fieldnames)
+
+            writer.writeheader()
+            for x in staffed_classes:
+                writer.writerow(x)
+
+        # These aren't in the file at all, so make sure nobody mistakes that
+        # for an empty course.
+        if len(skipped_classes) > 0:
+            logger.warning(
+                str(len(skipped_classes))
+                + " course(s) couldn't be listed and aren't in course_staffing.csv:"
+            )
+            for x in skipped_classes:
+                logger.warning("  " + x["URL"])
+    # Write out a new csv with the ones we couldn't do.
+    else:
+        # And one with how every single change went.
+        with open("staffing_results.csv", "w", newline="") as results_file:
+            fieldnames = ["Course", "URL", "Action", "Email", "Result"]
+            writer = csv.DictWriter(results_file, fieldnames=fieldnames)
+
+            writer.writeheader()
+            for x in action_results:
+                writer.writerow(x)
+
+        changed = len([x for x in action_results if x["Result"] == "done"])
+        unchanged = len([x for x in action_results if x["Result"] == "unchanged"])
+        logger.info(
+            str(changed)
+            + " changes confirmed, "
+            + str(unchanged)
+            + " already in place, "
+            + str(len(action_results) - changed - unchanged)
+            + " failed. See staffing_results.csv for details."
+        )
 
-            logger.info("\n" + driver.title)
-            logger.info(each_row["URL"])
-            # Functions to call for each task. As of Python 3.6 they'll stay in this order.
-            jobs = {
-                "Add": addStaff,
-                "Promote": promoteStaff,
-                "Demote": demoteStaff,
-                "Remove": removeStaff,
-            }
-            for j in jobs:
-                if each_row[j] is None:
-                    driver.quit()
-                    logger.error("CSV error - might be missing a column.")
-                    continue
-                # Taking out whitespace.
-                # Split e-mail list on spaces and throw out blank elements.
-                email_list_with_blanks = each_row[j].split(" ")
-                email_list = [x for x in email_list_with_blanks if x != ""]
-                email_list = [x.strip() for x in email_list]
-                if len(each_row[j]) > 0:
-                    jobs[j](driver, email_list)
-                    # You have to wait because I don't even know why.
-                    # Otherwise it skips lines - sometimes up to half of them.
-                    time.sleep(2)
-
-        # Done with the webdriver.
-        driver.quit()
-
-        # In list mode, save a CSV with our course staff.
-        if args.list:
+        if len(skipped_classes) > 0:
             logger.info(
-                "See course_staffing.csv for a full list of course staff and administrators."
+                "See remaining_courses.csv for courses that had to be skipped."
             )
-            with open("course_staffing.csv", "w", newline="") as all_staff:
-                fieldnames = ["Course", "URL", "Admin", "Staff"]
-                writer = csv.DictWriter(all_staff, fieldnames=fieldnames)
+            with open(
+                "remaining_courses.csv", "w", newline=""
+            ) as remaining_courses:
+                fieldnames = ["Course", "URL", "Add", "Promote", "Remove", "Demote"]
+                if has_deadlines:
+                    fieldnames.append("Deadline")
+                writer = csv.DictWriter(
+                    remaining_courses, fieldnames=fieldnames, extrasaction="ignore"
+                )
 
                 writer.writeheader()
-                for x in staffed_classes:
+                for x in skipped_classes:
                     writer.writerow(x)
-        # Write out a new csv with the ones we couldn't do.
-        else:
-            if len(skipped_classes) > 0:
-                logger.info(
-                    "See remaining_courses.csv for courses that had to be skipped."
-                )
-                with open(
-                    "remaining_courses.csv", "w", newline=""
-                ) as remaining_courses:
-                    fieldnames = ["Course", "URL", "Add", "Promote", "Remove", "Demote"]
-                    writer = csv.DictWriter(
-                        remaining_courses, fieldnames=fieldnames, extrasaction="ignore"
-                    )
-
-                    writer.writeheader()
-                    for x in skipped_classes:
-                        writer.writerow(x)
-
-        logger.info("Processed " + str(num_classes - len(skipped_classes)) + " courses")
-        end_time = datetime.datetime.now()
-        logger.info("in " + str(end_time - start_time).split(".")[0])
+
+    logger.info("Processed " + str(len(finished_classes)) + " courses")
+    end_time = datetime.datetime.now()
+    logger.info("in " + str(end_time - start_time).split(".")[0])
 
     # Done.
 
@@ -3,3 +3,6 @@
 __author__ = "Colin Fredericks"
 __email__ = "colin_fredericks"
 __version__ = "1.2.1" # Skipping CS50
+
+# The library interface. None of this loads Selenium until it's needed.
+from edx_replace_staff.api import StaffChange, StaffingSession, runBatch
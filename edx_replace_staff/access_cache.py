@@ -0,0 +1,94 @@
+"""
+Remembers which courses we couldn't work on last time, and why, so we
+don't have to load their pages again just to find out the same thing.
+
+The cache is a JSON file that maps each course URL to what happened
+("forbidden", "not_admin", "old_url", or "timeout") and when. Entries
+expire after a while, since someone may have given us access since then.
+Timeouts expire sooner, because they're usually not about the course.
+"""
+
+from __future__ import annotations
+
+import os
+import json
+import datetime
+import logging
+import threading
+
+logger = logging.getLogger(__name__)
+
+# The reasons worth remembering. Anything else gets tried again next time.
+cached_reasons = ["forbidden", "not_admin", "old_url", "timeout"]
+
+default_cache_file = "course_access_cache.json"
+default_ttl_days = 7
+timeout_ttl_days = 1
+
+
+class AccessCache:
+    """
+    Course access results, kept in a JSON file between runs.
+    Safe to share between worker threads.
+
+    Parameters:
+    path (str): The JSON file. Created if it doesn't exist.
+    ttl_days (float): How long to trust an entry, in days.
+    """
+
+    def __init__(self, path: str = default_cache_file, ttl_days: float = default_ttl_days):
+        self.path = path
+        self.ttl = datetime.timedelta(days=ttl_days)
+        self.lock = threading.Lock()
+        self.entries = {}
+
+        if os.path.exists(path):
+            try:
+                with open(path, "r") as f:
+                    self.entries = json.load(f)
+            except (OSError, ValueError) as e:
+                logger.warning("Couldn't read access cache " + path + ": " + str(e))
+
+    def knownBad(self, url: str) -> str | None:
+        """
+        Returns why we couldn't work on this course last time,
+        or None if we don't know of a problem (or it's too old to trust).
+        """
+        with self.lock:
+            entry = self.entries.get(url.strip())
+        if entry is None:
+            return None
+
+        ttl = self.ttl
+        if entry["reason"] == "timeout":
+            ttl = min(ttl, datetime.timedelta(days=timeout_ttl_days))
+        checked = datetime.datetime.fromisoformat(entry["checked"])
+        if datetime.datetime.now() - checked > ttl:
+            return None
+        return entry["reason"]
+
+    def record(self, url: str, reason: str | None) -> None:
+        """
+        Notes how a course went. A reason from cached_reasons gets remembered.
+        None means the course worked, so anything we had on it is dropped.
+        Other reasons are ignored.
+        """
+        url = url.strip()
+        with self.lock:
+            if reason in cached_reasons:
+                self.entries[url] = {
+                    "reason": reason,
+                    "checked": datetime.datetime.now().isoformat(timespec="seconds"),
+                }
+            elif reason is None:
+                self.entries.pop(url, None)
+
+    def save(self) -> None:
+        """Writes the cache back to its file."""
+        with self.lock:
+            entries = dict(self.entries)
+        # Write to a temporary file first so a crash can't leave half a file.
+        temp_path = self.path + ".tmp"
+        with open(temp_path, "w") as f:
+            json.dump(entries, f, indent=1, sort_keys=True)
+        os.replace(temp_path, self.path)
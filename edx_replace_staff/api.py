@@ -0,0 +1,551 @@
+"""
+Library interface for making staffing changes from other Python code.
+
+    from edx_replace_staff import StaffChange, StaffingSession
+
+    with StaffingSession(sessions=2) as session:
+        results = session.runBatch(
+            [StaffChange(url, "Add", "someone@example.com")]
+        )
+
+A session keeps its browsers open and signed in between batches, so a
+long-running job runner only pays for browser startup and login once.
+Credentials come from the arguments, a JSON file, or the EDX_USERNAME
+and EDX_PASSWORD environment variables. Nothing in here prompts for input
+or writes files; that's up to the caller.
+
+Selenium isn't loaded until a session actually starts a browser.
+"""
+
+from __future__ import annotations
+
+import os
+import json
+import queue
+import logging
+import threading
+from dataclasses import dataclass
+from edx_replace_staff.scheduler import (
+    action_columns,
+    splitEmails,
+    parseDeadline,
+    scheduleKey,
+    ProgressTracker,
+)
+
+logger = logging.getLogger(__name__)
+
+# If this many course pages in a row time out, a worker gives up.
+too_many_timeouts = 3
+
+
+@dataclass
+class StaffChange:
+    """
+    One change to one person's access in one course.
+
+    url: The course's Course Team Settings page.
+    action: "Add", "Promote", "Demote", or "Remove".
+    email: The person's e-mail address.
+    course: Course name or identifier, for the reports. Optional.
+    deadline: When this needs to be done by, like "2024-05-01 17:00". Optional.
+    """
+
+    url: str
+    action: str
+    email: str
+    course: str = ""
+    deadline: str = ""
+
+    def __post_init__(self):
+        for field in ["url", "action", "email", "course", "deadline"]:
+            if not isinstance(getattr(self, field), str):
+                raise ValueError(field + " has to be a string.")
+        if self.action not in action_columns:
+            raise ValueError("Unknown action: " + repr(self.action))
+        # Make sure it's readable now rather than halfway through a batch.
+        parseDeadline(self.deadline)
+
+
+def changesFromRows(rows: list[dict]) -> list[StaffChange]:
+    """Turns rows from a staffing CSV into a list of StaffChanges."""
+    changes = []
+    for row in rows:
+        if (row.get("URL") or "").strip() == "":
+            continue
+        for column in action_columns:
+            for email in splitEmails(row.get(column)):
+                changes.append(
+                    StaffChange(
+                        url=row["URL"].strip(),
+                        action=column,
+                        email=email,
+                        course=row.get("Course") or "",
+                        deadline=row.get("Deadline") or "",
+                    )
+                )
+    return changes
+
+
+def rowsFromChanges(changes: list[StaffChange]) -> list[dict]:
+    """
+    Groups StaffChanges into one CSV-style row per course, so that each
+    course page only gets opened once. Courses stay in the order they
+    first show up. A course's deadline is the earliest of its changes'.
+    """
+    rows = {}
+    for change in changes:
+        url = change.url.strip()
+        if url not in rows:
+            rows[url] = {"Course": change.course, "URL": url, "Deadline": ""}
+            for column in action_columns:
+                rows[url][column] = []
+        row = rows[url]
+        if change.email not in row[change.action]:
+            row[change.action].append(change.email)
+        if change.deadline.strip() != "":
+            current = parseDeadline(row["Deadline"])
+            if current is None or parseDeadline(change.deadline) < current:
+                row["Deadline"] = change.deadline.strip()
+
+    for row in rows.values():
+        for column in action_columns:
+            row[column] = " ".join(row[column])
+    return list(rows.values())
+
+
+def getCredentials(credentials_file: str | None = None) -> tuple[str, str] | None:
+    """
+    Finds the edX username and password without asking anyone.
+
+    Looks in this order:
+        credentials_file, if given,
+        the file named by EDX_CREDENTIALS_FILE,
+        the EDX_USERNAME and EDX_PASSWORD environment variables.
+    Files are JSON, like {"username": "...", "password": "..."}.
+
+    Returns (username, password), or None if there aren't any.
+    Raises ValueError if a credentials file can't be read or is missing
+    either one.
+    """
+    credentials_file = credentials_file or os.environ.get("EDX_CREDENTIALS_FILE")
+    if credentials_file:
+        try:
+            with open(credentials_file, "r") as f:
+                info = json.load(f)
+        except OSError as e:
+            raise ValueError(
+                "Can't read credentials file " + credentials_file + ": " + str(e)
+            ) from None
+        except ValueError as e:
+            # json.JSONDecodeError is a ValueError too.
+            raise ValueError(
+                "Credentials file " + credentials_file + " isn't valid JSON: " + str(e)
+            ) from None
+        if not isinstance(info, dict) or not (
+            info.get("username") and info.get("password")
+        ):
+            raise ValueError(
+                "Credentials file "
+                + credentials_file
+                + ' needs both "username" and "password".'
+            )
+        return (info["username"], info["password"])
+
+    if os.environ.get("EDX_USERNAME") and os.environ.get("EDX_PASSWORD"):
+        return (os.environ["EDX_USERNAME"], os.environ["EDX_PASSWORD"])
+
+    return None
+
+
+def skipReason(row: dict, include_cs50: bool = False) -> str | None:
+    """
+    Returns why we won't even open this course ("cs50" or "old_url"),
+    or None if it's fine to try.
+    """
+    # Skip CS50 courses unless we've specifically asked to include them.
+    if "cs50" in row["URL"].lower() and not include_cs50:
+        logger.info("Skipping CS50 course " + row["URL"])
+        return "cs50"
+
+    # Skip pre-2015 URL patterns that will no longer work.
+    # The newer one has a + instead of a /
+    if "HarvardX/" in row["URL"]:
+        logger.info("Skipping course with old URL scheme: " + row["URL"])
+        return "old_url"
+
+    return None
+
+
+def courseResults(row: dict, outcome: dict) -> list[dict]:
+    """
+    Turns one course's outcome into one result dict per change, with
+    Course, URL, Action, Email, and Result keys. If we never got to work
+    on the course, every change gets the course's status as its result.
+    """
+    base = {"Course": row.get("Course", ""), "URL": row["URL"]}
+    if outcome["status"] == "done":
+        return [base | action for action in outcome["actions"]]
+
+    results = []
+    for column in action_columns:
+        for email in splitEmails(row.get(column)):
+            results.append(
+                base | {"Action": column, "Email": email, "Result": outcome["status"]}
+            )
+    return results
+
+
+class StaffingSession:
+    """
+    A set of signed-in browsers that can run batch after batch of changes.
+
+    Parameters:
+    username, password (str): edX login. If left out, uses getCredentials().
+    credentials_file (str): JSON file to read the login from.
+    sessions (int): How many browsers to run side by side.
+    run_headless (bool): Whether to hide the browsers.
+    driver_choice (str): "firefox" or "chrome".
+    remote_url (str): Selenium Grid or standalone server address, if any.
+    include_cs50 (bool): Work on CS50 courses too.
+    access_cache (AccessCache): Where to remember courses we can't work on,
+        so we can skip them next time without loading them. Optional.
+    recheck (bool): Visit courses even if the cache says they're no good.
+    profiler (ResourceProfiler): Keeps track of memory and page-load times,
+        and says when to swap a browser for a fresh one. Optional.
+    """
+
+    def __init__(
+        self,
+        username: str | None = None,
+        password: str | None = None,
+        credentials_file: str | None = None,
+        sessions: int = 1,
+        run_headless: bool = True,
+        driver_choice: str = "firefox",
+        remote_url: str | None = None,
+        include_cs50: bool = False,
+        access_cache=None,
+        recheck: bool = False,
+        profiler=None,
+    ):
+        if username is None or password is None:
+            credentials = getCredentials(credentials_file)
+            if credentials is None:
+                raise ValueError(
+                    "No edX credentials. Pass them in, or set EDX_USERNAME and EDX_PASSWORD."
+                )
+            username, password = credentials
+
+        self.username = username
+        self.password = password
+        self.sessions = max(sessions, 1)
+        self.run_headless = run_headless
+        self.driver_choice = driver_choice
+        self.remote_url = remote_url
+        self.include_cs50 = include_cs50
+        self.access_cache = access_cache
+        self.recheck = recheck
+        self.profiler = profiler
+        self.drivers = []
+        # Saved from the last login, so new browsers can skip the login page.
+        self.cookies = []
+        # One batch at a time gets the browsers.
+        self.lock = threading.Lock()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def signIn(self, driver) -> None:
+        """Signs a browser in. Raises RuntimeError if we can't."""
+        from edx_replace_staff import browser
+
+        browser.signIn(driver, self.username, self.password)
+        # We have to open the Studio outline in order to avoid CORS issues for some reason.
+        browser.openStudio(driver)
+        self.cookies = driver.get_cookies()
+
+    def startDriver(self):
+        """
+        Starts one browser and signs it in, reusing the last login's cookies
+        if we have them. Raises RuntimeError if we can't sign in.
+        """
+        from edx_replace_staff import browser
+
+        driver = browser.setUpWebdriver(
+            self.run_headless, self.driver_choice, self.remote_url
+        )
+        try:
+            if len(self.cookies) > 0 and browser.restoreLogin(driver, self.cookies):
+                logger.info("Reused saved login.")
+            else:
+                self.signIn(driver)
+        except Exception:
+            browser.quitDriver(driver)
+            raise
+        return driver
+
+    def recycleDriver(self, driver):
+        """
+        Swaps a browser for a fresh one. Returns the new one, or the old one
+        if a new one couldn't be started.
+        """
+        from edx_replace_staff import browser
+
+        try:
+            new_driver = self.startDriver()
+        except Exception as e:
+            logger.warning("Couldn't start a replacement browser: " + str(e))
+            if self.profiler is not None:
+                self.profiler.postpone(driver)
+            return driver
+
+        self.drivers[self.drivers.index(driver)] = new_driver
+        browser.quitDriver(driver)
+        if self.profiler is not None:
+            self.profiler.forget(driver)
+        return new_driver
+
+    def start(self, count: int | None = None) -> None:
+        """
+        Makes sure we have `count` healthy, signed-in browsers (default: as
+        many as we were asked for). Dead ones get replaced. Called for you
+        by runBatch(), but you can call it early to warm things up.
+        Raises RuntimeError if we end up with no browsers at all.
+        """
+        from edx_replace_staff import browser
+
+        count = min(count or self.sessions, self.sessions)
+
+        healthy = []
+        for driver in self.drivers:
+            if browser.driverIsHealthy(driver):
+                healthy.append(driver)
+            else:
+                logger.warning("Replacing a browser session that stopped responding.")
+                browser.quitDriver(driver)
+        self.drivers = healthy
+
+        error = None
+        while len(self.drivers) < count:
+            try:
+                self.drivers.append(self.startDriver())
+            except Exception as e:
+                # Bad credentials won't get better by trying again.
+                error = e
+                break
+
+        if len(self.drivers) == 0:
+            raise RuntimeError(
+                "Could not start a browser session"
+                + (": " + str(error) if error is not None else ".")
+            )
+        if error is not None:
+            logger.warning(
+                "Only started " + str(len(self.drivers)) + " browser session(s)."
+            )
+
+    def close(self) -> None:
+        """Shuts down all the browsers."""
+        if len(self.drivers) == 0:
+            return
+        from edx_replace_staff import browser
+
+        for driver in self.drivers:
+            browser.quitDriver(driver)
+        self.drivers = []
+
+    def runRows(
+        self, rows: list[dict], list_only: bool = False, on_course=None
+    ) -> list[tuple]:
+        """
+        Works through CSV-style rows, one course per row, most urgent first.
+
+        Parameters:
+        rows (list): Dicts with a URL column and the action columns.
+        list_only (bool): Just collect who's admin and staff. Make no changes.
+        on_course (function): Called with (row, outcome) as each course is
+            finished, from whichever thread finished it.
+
+        Returns a list of (row, outcome) pairs, one per row with a URL.
+        Outcomes are what browser.processCourse() returns. Rows we never
+        opened have a status of "skipped" and a "reason". If the reason
+        came from the access cache, "cached" is True.
+        """
+        outcomes = []
+
+        def finished(row, outcome):
+            outcomes.append((row, outcome))
+            if self.access_cache is not None and not outcome.get("cached"):
+                if outcome["status"] == "done":
+                    self.access_cache.record(row["URL"], None)
+                elif outcome["status"] == "listed":
+                    # Listing only shows we can open the course, not that
+                    # we're admin there, so a not_admin note still stands.
+                    if self.access_cache.knownBad(row["URL"]) != "not_admin":
+                        self.access_cache.record(row["URL"], None)
+                else:
+                    self.access_cache.record(
+                        row["URL"], outcome.get("reason", outcome["status"])
+                    )
+            if on_course is not None:
+                on_course(row, outcome)
+
+        work = queue.PriorityQueue()
+        for index, row in enumerate(rows):
+            if (row.get("URL") or "").strip() == "":
+                continue
+            reason = skipReason(row, self.include_cs50)
+            if reason is not None:
+                finished(row, {"status": "skipped", "reason": reason})
+                continue
+            # Don't bother loading courses we already know we can't work on.
+            if self.access_cache is not None and not self.recheck:
+                reason = self.access_cache.knownBad(row["URL"])
+                # Listing doesn't need admin rights, so not_admin doesn't matter.
+                if list_only and reason == "not_admin":
+                    reason = None
+                if reason is not None:
+                    logger.info(
+                        "Skipping " + row["URL"] + " (" + reason + " last time)."
+                    )
+                    finished(
+                        row, {"status": "skipped", "reason": reason, "cached": True}
+                    )
+                    continue
+            # In list mode there's nothing urgent, so keep file order.
+            key = (index,) if list_only else scheduleKey(row, index)
+            work.put((key, row))
+
+        if work.empty():
+            if self.access_cache is not None:
+                self.access_cache.save()
+            return outcomes
+
+        with self.lock:
+            from edx_replace_staff.browser import processCourse
+
+            self.start(work.qsize())
+            progress = ProgressTracker(len(self.drivers))
+            for key, row in list(work.queue):
+                progress.addRow(row)
+
+            def runWorker(number, driver):
+                """Works through the queue with one browser until it's empty."""
+                timeouts = 0
+                while True:
+                    try:
+                        key, each_row = work.get_nowait()
+                    except queue.Empty:
+                        return
+
+                    try:
+                        outcome = processCourse(
+                            driver, each_row, self.username, list_only
+                        )
+                        # If our login ran out, sign back in and try once more.
+                        if outcome["status"] == "signed_out":
+                            logger.info("Signing back in.")
+                            self.signIn(driver)
+                            outcome = processCourse(
+                                driver, each_row, self.username, list_only
+                            )
+                    except Exception as e:
+                        logger.error("Problem with " + each_row["URL"] + ": " + repr(e))
+                        outcome = {"status": "skipped", "reason": "error"}
+                    finished(each_row, outcome)
+                    progress.finishRow(each_row, outcome.get("timings"))
+                    logger.info(progress.summary())
+
+                    if self.profiler is not None:
+                        reason = self.profiler.sample(number, driver, each_row, outcome)
+                        if reason is not None:
+                            logger.info(
+                                "Recycling browser session "
+                                + str(number)
+                                + " ("
+                                + reason
+                                + ")."
+                            )
+                            driver = self.recycleDriver(driver)
+
+                    if outcome["status"] == "timeout":
+                        timeouts += 1
+                        if timeouts >= too_many_timeouts:
+                            logger.warning(
+                                str(too_many_timeouts)
+                                + " course pages timed out in a row."
+                            )
+                            logger.warning(
+                                "Check URLs and internet connectivity and try again."
+                            )
+                            return
+                    else:
+                        timeouts = 0
+
+            # One thread per browser session. Selenium calls spend nearly all
+            # their time waiting on the browser, so threads are plenty.
+            workers = [
+                threading.Thread(target=runWorker, args=(i + 1, d))
+                for i, d in enumerate(self.drivers)
+            ]
+            for w in workers:
+                w.start()
+            for w in workers:
+                w.join()
+
+        # Anything left in the queue never got looked at.
+        while not work.empty():
+            finished(work.get_nowait()[1], {"status": "skipped", "reason": "not_reached"})
+
+        if self.access_cache is not None:
+            self.access_cache.save()
+        return outcomes
+
+    def runBatch(self, changes: list[StaffChange]) -> list[dict]:
+        """
+        Makes a batch of changes, reusing this session's browsers.
+
+        Returns one dict per change, with Course, URL, Action, Email, and
+        Result keys. Result is "done", "unchanged", "no_user", "not_in_course",
+        or "failed" for courses we worked on, and "skipped" or "timeout" for
+        courses we couldn't.
+        """
+        results = []
+        for row, outcome in self.runRows(rowsFromChanges(changes)):
+            results.extend(courseResults(row, outcome))
+        return results
+
+    def listStaff(self, urls: list[str]) -> list[dict]:
+        """
+        Collects who's admin and staff in each course.
+        Returns one dict per course with Course, URL, Admin, Staff, and
+        Status keys. Admin and Staff are lists of e-mail addresses.
+        """
+        rows = [{"Course": "", "URL": url} for url in urls]
+        staffing = []
+        for row, outcome in self.runRows(rows, list_only=True):
+            users = outcome.get("users", {"admin": [], "staff": []})
+            staffing.append(
+                {
+                    "Course": row.get("Course", ""),
+                    "URL": row["URL"],
+                    "Admin": users["admin"],
+                    "Staff": users["staff"],
+                    "Status": outcome["status"],
+                }
+            )
+        return staffing
+
+
+def runBatch(changes: list[StaffChange], **session_options) -> list[dict]:
+    """
+    One-off version of StaffingSession.runBatch(). Starts browsers, makes
+    the changes, and shuts them down again. Takes the same keyword
+    arguments as StaffingSession.
+    """
+    with StaffingSession(**session_options) as session:
+        return session.runBatch(changes)
@@ -0,0 +1,972 @@
+"""
+Browser-side helpers for the staffing script.
+
+Everything in here talks to Selenium. The CLI only imports this module
+once it actually needs a browser session, so that --help, CSV validation,
+and other offline commands don't pay for loading Selenium.
+"""
+
+from __future__ import annotations
+
+import os
+import time
+import logging
+import traceback
+import weakref
+from selenium import webdriver
+from selenium.webdriver.remote.webdriver import WebDriver
+from selenium.webdriver.common.action_chains import ActionChains
+from selenium.webdriver.chrome.options import Options as ChromeOptions
+from selenium.webdriver.firefox.options import Options as FirefoxOptions
+from selenium.webdriver.support.wait import WebDriverWait
+from selenium.common import exceptions as selenium_exceptions
+from selenium.webdriver.support import expected_conditions as EC
+from edx_replace_staff import locators
+from edx_replace_staff.scheduler import splitEmails
+
+logger = logging.getLogger(__name__)
+
+
+# Where the Mac installs Firefox. Elsewhere we let Selenium find it.
+mac_firefox_path = "/Applications/Firefox.app/Contents/MacOS/firefox"
+
+
+def findDriverExecutable(name: str) -> str | None:
+    """
+    Looks for a webdriver executable (chromedriver, geckodriver).
+    Checks EDX_STAFF_DRIVER_DIR first, then the folder this package is in.
+    Returns None if neither has one, in which case Selenium Manager
+    will try to find or download a driver on its own.
+    """
+    places = [os.environ.get("EDX_STAFF_DRIVER_DIR", ""), os.path.dirname(__file__)]
+    for place in places:
+        if place == "":
+            continue
+        candidate = os.path.join(place, name)
+        if os.path.isfile(candidate) and os.access(candidate, os.X_OK):
+            return candidate
+    return None
+
+
+# Instantiating a headless Chrome or Firefox browser
+def setUpWebdriver(
+    run_headless: bool, driver_choice: str = "firefox", remote_url: str | None = None
+) -> WebDriver:
+    """
+    Sets up a Chrome or Firefox browser, either locally or on a
+    Selenium Grid / standalone server. Never prompts for anything.
+
+    Parameters:
+    run_headless (bool): Whether to run the browser in headless mode.
+    driver_choice (str): Which browser to use. Default is firefox, "chrome" is an option.
+    remote_url (str): Address of a Selenium Grid or webdriver.Remote server,
+        like http://localhost:4444 . If None, starts a local browser.
+    """
+    logger.info("Setting up webdriver.")
+
+    if driver_choice == "chrome":
+        op = ChromeOptions()
+        op.add_argument("start-maximized")
+        op.timeouts = {"implicit": 1000}
+        if run_headless:
+            op.add_argument("--headless")
+    else:
+        op = FirefoxOptions()
+        op.timeouts = {"implicit": 1000}
+        if run_headless:
+            op.add_argument("-headless")
+
+    if remote_url is not None:
+        logger.info("Using remote webdriver at " + remote_url)
+        return webdriver.Remote(command_executor=remote_url, options=op)
+
+    if driver_choice == "chrome":
+        service = webdriver.ChromeService(
+            executable_path=findDriverExecutable("chromedriver")
+        )
+        driver = webdriver.Chrome(options=op, service=service)
+    else:
+        firefox_path = os.environ.get("FIREFOX_BINARY", mac_firefox_path)
+        if os.path.exists(firefox_path):
+            op.binary_location = firefox_path
+        service = webdriver.FirefoxService(
+            executable_path=findDriverExecutable("geckodriver")
+        )
+        driver = webdriver.Firefox(options=op, service=service)
+
+    return driver
+
+
+def driverIsHealthy(driver: WebDriver) -> bool:
+    """
+    Checks that a browser session is still alive and answering commands.
+    Returns boolean.
+    """
+    try:
+        driver.execute_script("return 1;")
+        return True
+    except selenium_exceptions.WebDriverException as e:
+        logger.debug("Health check failed: " + str(e))
+        return False
+
+
+def quitDriver(driver: WebDriver) -> None:
+    """Shuts down a browser session, even if it's already half-dead."""
+    try:
+        driver.quit()
+    except Exception as e:
+        logger.debug("Error while quitting driver: " + str(e))
+
+
+def signIn(driver: WebDriver, username: str, password: str) -> None:
+    """
+    Signs into edx.org
+    Raises RuntimeError if we can't. Whoever owns the driver should quit it.
+    """
+    # Open the edX sign-in page
+    logger.info("Logging in...")
+    driver.get(locators.login_page)
+
+    # Wait a second.
+    time.sleep(1)
+
+    # Apparently we have to run this more than once sometimes.
+    login_count = 0
+    while login_count < 3:
+        # Sign in
+        try:
+            WebDriverWait(driver, 10).until(
+                EC.presence_of_element_located(locators.username_input)
+            )
+        except selenium_exceptions.TimeoutException:
+            raise RuntimeError("Timed out waiting for username field.")
+
+        # Wait a second.
+        time.sleep(1)
+
+        username_field = driver.find_elements(*locators.username_input)[0]
+        username_field.clear()
+        username_field.send_keys(username)
+        logger.info("Username sent")
+
+        # Wait a second.
+        time.sleep(1)
+
+        password_field = driver.find_elements(*locators.password_input)[0]
+        password_field.clear()
+        password_field.send_keys(password)
+        logger.info("Password sent")
+
+        # Wait a second.
+        time.sleep(1)
+
+        # Using ActionChains is necessary because edX put a div over the login button.
+        login_button = driver.find_elements(*locators.login_button)[0]
+        actions = ActionChains(driver)
+        actions.move_to_element(login_button).click().perform()
+        logger.info("Login button clicked")
+
+        # Check to make sure we're signed in.
+        # There are several possible fail states to check for.
+        found_dashboard = False
+        try:
+            logger.info("Finding dashboard...")
+            found_dashboard = WebDriverWait(driver, 10).until(EC.url_contains("home"))
+        except (
+            selenium_exceptions.TimeoutException,
+            selenium_exceptions.InvalidSessionIdException,
+        ):
+            logger.debug(str(traceback.print_exc()), "WARNING")
+            login_fail = driver.find_elements(*locators.login_failure_alert)
+            if len(login_fail) > 0:
+                logger.info("Incorrect login or password")
+            need_reset = driver.find_elements(*locators.password_reset_notice)
+            if len(need_reset) > 0:
+                logger.error("Password reset required")
+            if "Forbidden" in driver.title:
+                logger.error("403: Forbidden")
+
+        # If we're logged in, we're done.
+        if found_dashboard:
+            logger.info("Logged in.")
+            return
+
+        login_count += 1
+        logger.info("Login attempt count: " + str(login_count))
+
+    logger.error("Login failed.")
+    raise RuntimeError("Login issue or course dashboard page timed out.")
+
+
+# Runs in the browser. Reads every team member's row in one go,
+# along with their e-mail address and Admin/Staff badge.
+team_roster_script = """
+var rowCss = arguments[0], linkCss = arguments[1], badgeCss = arguments[2];
+return Array.from(document.querySelectorAll(rowCss)).map(function (row) {
+    var link = row.querySelector(linkCss);
+    var badge = row.querySelector(badgeCss);
+    return [
+        row,
+        link ? link.textContent.trim() : "",
+        link ? (link.getAttribute("href") || "") : "",
+        badge ? badge.textContent : ""
+    ];
+});
+"""
+
+
+class TeamRoster:
+    """
+    What we know about the Course Team page open in one browser:
+    each member's row element, e-mail address, and role.
+
+    The whole list is read with one script call and kept until the page
+    or the team changes. After that, checking on someone is a dictionary
+    lookup, and their buttons are found inside their own row instead of
+    by searching the whole page.
+    """
+
+    def __init__(self, driver: WebDriver):
+        # Weak, so that keeping a roster around doesn't keep the browser alive.
+        self.driver_ref = weakref.ref(driver)
+        self.members = None
+        self.by_email = {}
+
+    def invalidate(self) -> None:
+        """Forget the team list. Call this whenever it might have changed."""
+        self.members = None
+        self.by_email = {}
+
+    def refresh(self, wait: float = 1) -> None:
+        """
+        Reads the team list from the page.
+        Waits up to `wait` seconds for it to show up. There's always at least
+        one member (us), so an empty list means the page isn't ready yet,
+        and we don't hang on to it.
+        """
+        driver = self.driver_ref()
+        self.invalidate()
+        if driver is None:
+            return
+
+        deadline = time.monotonic() + wait
+        while True:
+            rows = driver.execute_script(
+                team_roster_script,
+                locators.member_row_css,
+                locators.member_email_link_css,
+                locators.member_badge_css,
+            )
+            if rows or time.monotonic() >= deadline:
+                break
+            time.sleep(0.1)
+
+        if not rows:
+            logger.debug("No team members found on " + driver.title)
+            return
+
+        self.members = []
+        for row, text, href, badge in rows:
+            role = None
+            if "Admin" in badge:
+                role = "admin"
+            elif "Staff" in badge:
+                role = "staff"
+            member = {"email": text, "row": row, "role": role}
+            self.members.append(member)
+            # E-mail addresses in the link are lowercased, but check the href too.
+            for key in [text.lower(), href.lower().replace("mailto:", "")]:
+                if key != "":
+                    self.by_email.setdefault(key, member)
+
+    def allMembers(self) -> list[dict]:
+        """Returns every member as a dict with "email", "row", and "role"."""
+        if self.members is None:
+            self.refresh()
+        return self.members or []
+
+    def member(self, email: str) -> dict | None:
+        """Returns one member's dict, or None if they're not on the team."""
+        if self.members is None:
+            self.refresh()
+        return self.by_email.get(email.lower())
+
+    def findInRow(self, email: str, locator: tuple) -> list:
+        """
+        Finds elements inside one member's row, using a row_ locator.
+        If the row has gone stale (the page re-rendered), re-reads the
+        team list once and tries again.
+        """
+        for x in range(0, 2):
+            member = self.member(email)
+            if member is None:
+                return []
+            try:
+                return member["row"].find_elements(*locator)
+            except selenium_exceptions.StaleElementReferenceException:
+                logger.debug("Row for " + email + " went stale. Re-reading team list.")
+                self.refresh()
+        return []
+
+
+# One roster per browser session.
+team_rosters = weakref.WeakKeyDictionary()
+
+
+def getTeamRoster(driver: WebDriver) -> TeamRoster:
+    """Returns the TeamRoster for this browser, making one if needed."""
+    roster = team_rosters.get(driver)
+    if roster is None:
+        roster = TeamRoster(driver)
+        team_rosters[driver] = roster
+    return roster
+
+
+# How long to wait for the team list to show up on a freshly loaded page.
+team_load_timeout = 5
+
+
+def teamListLoaded(driver: WebDriver) -> bool:
+    """
+    Waits for the team list to show up. Returns False if it never does.
+    There's always at least one member (us), so an empty list means the
+    page didn't finish, not that nobody's there.
+    """
+    roster = getTeamRoster(driver)
+    if roster.members is None:
+        roster.refresh(wait=team_load_timeout)
+    return roster.members is not None
+
+
+def userIsPresent(driver: WebDriver, email: str) -> bool:
+    """Checks to see if user is already on course team. Returns boolean."""
+    logger.debug("Is " + email + " present?")
+
+    if getTeamRoster(driver).member(email) is not None:
+        logger.debug(email + " is on the course team.")
+        return True
+    else:
+        logger.debug(email + " is not on the course team.")
+        return False
+
+
+def userIsStaff(driver: WebDriver, email: str) -> bool:
+    """Checks to see if user is staff. Returns boolean."""
+    member = getTeamRoster(driver).member(email)
+    if member is not None and member["role"] == "staff":
+        logger.debug(email + " is staff.")
+        return True
+    else:
+        logger.debug(email + " is not staff.")
+        return False
+
+
+def userIsAdmin(driver: WebDriver, email: str) -> bool:
+    """
+    Checks to see whether the user we're signed in as is admin.
+    If not, we can't do anything - you need to be admin to make changes.
+    Returns boolean.
+    """
+    member = getTeamRoster(driver).member(email)
+    if member is not None and member["role"] == "admin":
+        logger.debug(email + " is admin.")
+        return True
+    else:
+        logger.debug(email + " is not admin.")
+        return False
+
+
+def getAllUsers(driver: WebDriver) -> dict:
+    """
+    Returns a dictionary with two lists of e-mail addresses: staff and admin.
+    """
+    members = getTeamRoster(driver).allMembers()
+    staff_list = [m["email"] for m in members if m["role"] == "staff"]
+    admin_list = [m["email"] for m in members if m["role"] == "admin"]
+
+    return {"staff": staff_list, "admin": admin_list}
+
+
+# How long to wait for the page to show that a change went through.
+confirm_timeout = 10
+
+# Runs in the browser. Keeps an eye on the team list and records every
+# change in membership or role, so we can confirm each action as soon as
+# the page shows it instead of re-querying the team list over and over.
+team_watch_script = """
+var rowCss = arguments[0], linkCss = arguments[1], badgeCss = arguments[2];
+if (window.edxStaffWatch) { return true; }
+function readRoles() {
+    var roles = {};
+    document.querySelectorAll(rowCss).forEach(function (row) {
+        var link = row.querySelector(linkCss);
+        if (!link) { return; }
+        var badge = row.querySelector(badgeCss);
+        var text = badge ? badge.textContent : "";
+        var role = "member";
+        if (text.indexOf("Admin") >= 0) { role = "admin"; }
+        else if (text.indexOf("Staff") >= 0) { role = "staff"; }
+        var email = link.textContent.trim().toLowerCase() ||
+            (link.getAttribute("href") || "").toLowerCase().replace("mailto:", "");
+        roles[email] = role;
+    });
+    return roles;
+}
+var watch = {roles: readRoles(), changes: [], waiters: []};
+watch.check = function () {
+    var before = watch.roles, now = readRoles();
+    Object.keys(before).forEach(function (email) {
+        if (now[email] !== before[email]) {
+            watch.changes.push({email: email, before: before[email], after: now[email] || null});
+        }
+    });
+    Object.keys(now).forEach(function (email) {
+        if (!(email in before)) {
+            watch.changes.push({email: email, before: null, after: now[email]});
+        }
+    });
+    watch.roles = now;
+    // Waiters return true once they're finished with.
+    watch.waiters = watch.waiters.filter(function (waiter) { return !waiter(); });
+};
+new MutationObserver(watch.check).observe(
+    document.body, {childList: true, subtree: true, characterData: true}
+);
+window.edxStaffWatch = watch;
+return true;
+"""
+
+# Runs in the browser, asynchronously. Finishes as soon as the watcher
+# sees `email` reach the state we want, an error dialog shows up, or
+# time runs out. Hands back whatever changes were seen along the way.
+team_wait_script = """
+var email = arguments[0].toLowerCase(), want = arguments[1];
+var timeoutMs = arguments[2], errorCss = arguments[3];
+var done = arguments[arguments.length - 1];
+var watch = window.edxStaffWatch;
+if (!watch) { done(null); return; }
+var finished = false, timer = null;
+function finish(result) {
+    finished = true;
+    if (timer) { clearTimeout(timer); }
+    done({result: result, changes: watch.changes.splice(0)});
+}
+function settle() {
+    if (finished) { return true; }
+    var role = watch.roles[email];
+    var reached = (want === "absent") ? role === undefined
+        : (want === "present") ? role !== undefined
+        : role === want;
+    if (reached) { finish("ok"); return true; }
+    if (errorCss && document.querySelector(errorCss)) { finish("error"); return true; }
+    return false;
+}
+watch.check();
+if (settle()) { return; }
+watch.waiters.push(settle);
+timer = setTimeout(function () { finish("timeout"); }, timeoutMs);
+"""
+
+
+def installTeamWatch(driver: WebDriver) -> None:
+    """Starts watching the team list on the current page. Safe to call twice."""
+    # Leave the async script a little longer than its own timer.
+    driver.set_script_timeout(confirm_timeout + 5)
+    driver.execute_script(
+        team_watch_script,
+        locators.member_row_css,
+        locators.member_email_link_css,
+        locators.member_badge_css,
+    )
+
+
+def waitForTeamChange(
+    driver: WebDriver, email: str, want: str, error_css: str = ""
+) -> str:
+    """
+    Waits for the page to show that a change went through.
+
+    Parameters:
+    driver (WebDriver): The browser, on a Course Team page.
+    email (str): Whose entry we're watching.
+    want (str): "present", "absent", "admin", or "staff".
+    error_css (str): If an element matching this shows up, stop waiting.
+
+    Returns "ok", "error" (the error element showed up), or "timeout".
+    """
+    for x in range(0, 2):
+        try:
+            outcome = driver.execute_async_script(
+                team_wait_script, email, want, confirm_timeout * 1000, error_css
+            )
+        except selenium_exceptions.TimeoutException:
+            return "timeout"
+
+        # No watcher means the page was reloaded. Start a new one and try again.
+        if outcome is None:
+            installTeamWatch(driver)
+            continue
+
+        for change in outcome["changes"]:
+            logger.debug(
+                "Team change: "
+                + change["email"]
+                + " "
+                + str(change["before"])
+                + " -> "
+                + str(change["after"])
+            )
+        return outcome["result"]
+
+    return "timeout"
+
+
+def closeErrorDialog(driver: WebDriver) -> dict:
+    """
+    Closes error dialogs on the course staff page. Can't go on without that.
+
+    Returns info about the dialog.
+        If there was none, it's "no_dialog"
+        If we closed it and they weren't a user, it's "no_user"
+        If we couldn't close the dialog, it's "failed_to_close"
+    """
+
+    # If there is an error dialog open, report why, clear it, and move on.
+    try:
+        logger.debug("Checking for error dialog")
+        wrong_email_ok_button = WebDriverWait(driver, 5).until(
+            EC.presence_of_element_located(locators.error_dialog_ok_button)
+        )
+        if wrong_email_ok_button is None:
+            logger.debug("No error dialog found.")
+            return {"reason": "no_dialog"}
+        else:
+            logger.debug("Error dialog found.")
+    except Exception:
+        # If there was no error dialog, we can move on.
+        logger.debug("No error dialog found.")
+        return {"reason": "no_dialog"}
+
+    try:
+        # No user with specified e-mail address.
+        # (At least, that's the only current error shown.)
+        wrong_email_ok_button.click()
+        return {"reason": "no_user"}
+    except Exception as e:
+        # Couldn't close the error dialog.
+        logger.warning("Could not close error dialog for " + driver.title)
+        logger.debug(str(e))
+        return {"reason": "failed_to_close"}
+
+
+def addStaff(driver: WebDriver, email_list: list[str]) -> dict:
+    """
+    Adds a list of users as course staff via e-mail address. You can promote them to admin later.
+    Returns a dict of e-mail address -> result ("done", "unchanged", "no_user", or "failed").
+    """
+
+    logger.info("Adding staff to " + driver.title)
+    roster = getTeamRoster(driver)
+    error_css = locators.error_dialog_ok_button[1]
+    results = {}
+
+    # For each address:
+    for email in email_list:
+        logger.info("Adding " + email)
+
+        # If the user is already present, move to the next e-mail address.
+        if userIsPresent(driver, email):
+            logger.debug(email + " is already on course team.")
+            results[email] = "unchanged"
+            continue
+        else:
+            logger.debug(email + " is not on course team yet.")
+
+        # Retry up to 3 times.
+        result = "failed"
+        for x in range(0, 3):
+            try:
+                # Click the "New Team Member" button
+                new_team_buttons = driver.find_elements(
+                    *locators.new_team_member_button
+                )
+                new_team_buttons[0].click()
+                logger.debug("Clicked 'New Team Member'")
+            except Exception:
+                # If that failed, there could be an error message up. Try to close it.
+                closeErrorDialog(driver)
+
+            try:
+                # Put the e-mail into the input box.
+                email_boxes = driver.find_elements(*locators.new_staff_email_input)
+                email_boxes[0].clear()
+                email_boxes[0].send_keys(email)
+                # Click "Add User"
+                add_user_buttons = driver.find_elements(*locators.add_user_button)
+                add_user_buttons[0].click()
+
+                # Now that we've clicked the add button,
+                # Either the user shows up in the list or there's an error dialog.
+                if waitForTeamChange(driver, email, "present", error_css) == "ok":
+                    # All good.
+                    result = "done"
+                    break
+                # Clear the dialog and try again (or move on).
+                if closeErrorDialog(driver)["reason"] == "no_user":
+                    # No point trying again for someone who doesn't exist.
+                    result = "no_user"
+                    break
+
+            except Exception:
+                # If the stuff above failed, it's probably because
+                # one of the elements hasn't been added to the page yet.
+                logger.warning("Couldn't add " + email + ", trying again...")
+                # logger.debug(repr(e))
+
+        roster.invalidate()
+        results[email] = result
+
+        if result == "done":
+            logger.info("Successfully added " + email)
+        else:
+            logger.info("Could not add " + email)
+            closeErrorDialog(driver)
+
+    return results
+
+
+def promoteStaff(driver: WebDriver, email_list: list[str]) -> dict:
+    """
+    Promotes a list of staff users to admin.
+    Returns a dict of e-mail address -> result ("done", "unchanged", "not_in_course", or "failed").
+    """
+
+    roster = getTeamRoster(driver)
+    results = {}
+
+    # For each address:
+    for email in email_list:
+        logger.info("Promoting " + email)
+
+        result = "failed"
+
+        if userIsStaff(driver, email):
+            # Keep trying up to 3 times in case we're still loading.
+            for x in range(0, 3):
+                # Find the "Add admin access" button in this user's row.
+                promotion_button = roster.findInRow(email, locators.row_promote_button)
+                if len(promotion_button) == 0:
+                    logger.warning(
+                        "No promotion button found. You may not have Admin access. Trying again..."
+                    )
+                    roster.refresh()
+                    continue
+                try:
+                    promotion_button[0].click()
+                except Exception:
+                    logger.debug("Couldn't click promotion button. Trying again...")
+                    continue
+                if waitForTeamChange(driver, email, "admin") == "ok":
+                    result = "done"
+                    break
+                logger.debug("Promotion didn't show up. Trying again...")
+                roster.refresh()
+            roster.invalidate()
+        else:
+            if userIsAdmin(driver, email):
+                logger.debug(email + " is already admin.")
+                result = "unchanged"
+            else:
+                logger.debug(
+                    email + " is not in this course. Add them before promoting them."
+                )
+                result = "not_in_course"
+
+        results[email] = result
+
+        if result == "done":
+            logger.info("Promoted " + email + " to Admin.")
+        else:
+            logger.info("Could not promote " + email)
+
+    return results
+
+
+def removeStaff(driver: WebDriver, email_list: list[str]) -> dict:
+    """
+    Removes a list of users from the course staff.
+    If they're admin you have to demote them first.
+    Returns a dict of e-mail address -> result ("done", "unchanged", or "failed").
+    """
+
+    logger.info("Removing staff from " + driver.title)
+    roster = getTeamRoster(driver)
+    results = {}
+
+    # For each address:
+    for email in email_list:
+        logger.debug("Removing " + email)
+
+        # If this user isn't present, move on to the next one.
+        if not userIsPresent(driver, email):
+            logger.debug(email + " was already not in this course.")
+            results[email] = "unchanged"
+            continue
+
+        result = "failed"
+
+        for x in range(0, 3):
+            try:
+                # Find the delete button in this user's row.
+                remove_button = roster.findInRow(email, locators.row_delete_button)
+                # Click the trash can ("remove user" button)
+                remove_button[0].click()
+                # Click the "confirm" button.
+                logger.debug("Trying to remove " + email)
+                confirm_button = WebDriverWait(driver, 5).until(
+                    EC.presence_of_element_located(locators.confirm_removal_button)
+                )
+                confirm_button.click()
+            except Exception:
+                # logger.debug(repr(e))
+                # Keep trying up to 3 times.
+                logger.debug("Trying again...")
+                roster.refresh()
+                continue
+
+            # Make sure they're really gone.
+            if waitForTeamChange(driver, email, "absent") == "ok":
+                result = "done"
+                break
+            logger.debug("Removal didn't show up. Trying again...")
+            roster.refresh()
+
+        roster.invalidate()
+        results[email] = result
+
+        if result == "done":
+            logger.info("Removed " + email)
+        else:
+            logger.info("Could not remove " + email)
+
+    return results
+
+
+def demoteStaff(driver: WebDriver, email_list: list[str]) -> dict:
+    """
+    Demotes a list of admin users to staff.
+    Returns a dict of e-mail address -> result ("done", "unchanged", "not_in_course", or "failed").
+    """
+
+    logger.info("Demoting staff in " + driver.title)
+    roster = getTeamRoster(driver)
+    results = {}
+
+    # For each address:
+    for email in email_list:
+        logger.debug("Demoting " + email)
+
+        result = "failed"
+
+        if userIsAdmin(driver, email):
+            # Keep trying up to 3 times in case we're still loading.
+            for x in range(0, 3):
+                # Find the "Remove admin access" button in this user's row.
+                demotion_button = roster.findInRow(email, locators.row_demote_button)
+                if len(demotion_button) == 0:
+                    logger.warning(
+                        "Couldn't find demotion button. You may not have Admin access. Trying again..."
+                    )
+                    roster.refresh()
+                    continue
+                try:
+                    demotion_button[0].click()
+                except Exception:
+                    logger.debug("Couldn't click demotion button. Trying again...")
+                    continue
+                if waitForTeamChange(driver, email, "staff") == "ok":
+                    result = "done"
+                    break
+                logger.debug("Demotion didn't show up. Trying again...")
+                roster.refresh()
+            roster.invalidate()
+        else:
+            if userIsStaff(driver, email):
+                logger.debug(email + " is already staff.")
+                result = "unchanged"
+            else:
+                logger.debug(email + " is not in this course.")
+                result = "not_in_course"
+
+        results[email] = result
+
+        if result == "done":
+            logger.info("Demoted " + email + " to staff.")
+        else:
+            logger.info("Could not demote " + email)
+
+    return results
+
+
+def openStudio(driver: WebDriver) -> None:
+    """
+    Opens the Studio home page. We have to do this once after signing in
+    in order to avoid CORS issues for some reason.
+    Raises RuntimeError if the page doesn't load.
+    """
+    driver.get(locators.studio_home_page)
+    # This redirects to https://course-authoring.edx.org/home , but we actually want to get the redirect!
+    # When the input with id pgn-searchfield-input-1 shows up we're good to continue.
+    try:
+        WebDriverWait(driver, 10).until(
+            EC.presence_of_element_located(locators.studio_search_field)
+        )
+    except selenium_exceptions.TimeoutException:
+        logger.error("Studio page load timed out.")
+        raise RuntimeError("Studio page load timed out.")
+
+
+def restoreLogin(driver: WebDriver, cookies: list[dict]) -> bool:
+    """
+    Signs a fresh browser in using cookies saved from an earlier login,
+    which is a lot quicker than going through the login page again.
+    Returns True if it worked. If not, sign in the usual way.
+    """
+    # Cookies can only be set for the site the browser is on,
+    # so visit each site once and set its cookies there.
+    by_domain = {}
+    for cookie in cookies:
+        by_domain.setdefault(cookie.get("domain", "").lstrip("."), []).append(cookie)
+
+    try:
+        for domain, domain_cookies in by_domain.items():
+            if domain == "":
+                continue
+            driver.get("https://" + domain + "/robots.txt")
+            for cookie in domain_cookies:
+                driver.add_cookie(cookie)
+        openStudio(driver)
+    except (RuntimeError, selenium_exceptions.WebDriverException) as e:
+        logger.debug("Couldn't restore login: " + str(e))
+        return False
+
+    return locators.login_host not in driver.current_url
+
+
+def openCourseTeamPage(driver: WebDriver, url: str) -> str:
+    """
+    Opens a Course Team Settings page.
+
+    Returns:
+        "ok" if the page loaded,
+        "timeout" if we ended up stuck on the dashboard,
+        "signed_out" if we got sent to the login page,
+        "failed" if the page didn't load for some other reason.
+    """
+    driver.get(url.strip())
+    # Anything we knew about the last page's team list is now useless.
+    getTeamRoster(driver).invalidate()
+
+    # Check to make sure we've opened a new page.
+    # The e-mail input box should be invisible.
+    try:
+        WebDriverWait(driver, 10).until(
+            EC.invisibility_of_element_located(locators.user_email_input)
+        )
+    except Exception:
+        # logger.debug(repr(e))
+        if "Dashboard" in driver.title:
+            logger.warning("Course Team page load timed out for " + url)
+            return "timeout"
+        return "failed"
+
+    if locators.login_host in driver.current_url:
+        logger.warning("Login has expired.")
+        return "signed_out"
+
+    installTeamWatch(driver)
+    return "ok"
+
+
+def processCourse(
+    driver: WebDriver, each_row: dict, username: str, list_only: bool = False
+) -> dict:
+    """
+    Opens one course and makes the changes in its CSV row.
+
+    Parameters:
+    driver (WebDriver): A signed-in browser session.
+    each_row (dict): One row from the input CSV.
+    username (str): The e-mail address we signed in with.
+    list_only (bool): Just collect who's admin and staff. Make no changes.
+
+    Returns a dict with a "timings" key, holding seconds spent on the
+    page load and on each job that ran, and a "status" key:
+        "done" if we made (or tried to make) the changes, with an "actions"
+            key listing each change and how it went,
+        "listed" if we collected staff, with an "users" key holding them,
+        "timeout" if the page load timed out or the team list never showed up,
+        "signed_out" if our login expired, so the course should be retried,
+        "skipped" if we couldn't work on this course, with a "reason" key:
+            "forbidden", "not_admin", or "failed".
+    """
+    start = time.monotonic()
+    page_status = openCourseTeamPage(driver, each_row["URL"])
+    timings = {"Page": time.monotonic() - start}
+    if page_status == "failed":
+        return {"status": "skipped", "reason": "failed", "timings": timings}
+    if page_status != "ok":
+        return {"status": page_status, "timings": timings}
+
+    title = driver.title
+    if "Forbidden" in title:
+        logger.warning("\nForbidden: " + each_row["URL"])
+        return {"status": "skipped", "reason": "forbidden", "timings": timings}
+
+    if not list_only and "Course team" not in title:
+        logger.warning("\nCould not open course " + each_row["URL"])
+        return {"status": "skipped", "reason": "failed", "timings": timings}
+
+    # Without the team list we can't tell who's there, or whether we're admin.
+    # Call it a timeout rather than guessing, so it gets tried again soon.
+    if not teamListLoaded(driver):
+        logger.warning("\nTeam list didn't load for " + each_row["URL"])
+        return {"status": "timeout", "timings": timings}
+
+    # If we only need to get users and status, we can do that easier.
+    if list_only:
+        logger.info("Getting staff for " + each_row["URL"])
+        return {"status": "listed", "users": getAllUsers(driver), "timings": timings}
+
+    # Check to make sure we have the ability to change user status.
+    if not userIsAdmin(driver, username.lower()):
+        logger.warning("\nUser is not admin in " + each_row["URL"])
+        return {"status": "skipped", "reason": "not_admin", "timings": timings}
+
+    logger.info("\n" + title)
+    logger.info(each_row["URL"])
+    # Functions to call for each task. As of Python 3.6 they'll stay in this order.
+    # Taking access away goes first, like it does when scheduling rows, so a
+    # removal never waits behind a long list of additions. Admins have to be
+    # demoted before they can be removed, and people have to be on the team
+    # before they can be promoted.
+    jobs = {
+        "Demote": demoteStaff,
+        "Remove": removeStaff,
+        "Add": addStaff,
+        "Promote": promoteStaff,
+    }
+    actions = []
+    for j in jobs:
+        # Taking out whitespace.
+        email_list = splitEmails(each_row[j])
+        if len(email_list) > 0:
+            # Every change is confirmed on the page before we move on,
+            # so there's no need to sleep between jobs any more.
+            start = time.monotonic()
+            results = jobs[j](driver, email_list)
+            timings[j] = time.monotonic() - start
+            for email in results:
+                actions.append({"Action": j, "Email": email, "Result": results[email]})
+
+    return {"status": "done", "actions": actions, "timings": timings}
@@ -0,0 +1,285 @@
+"""
+Keeps signed-in browsers running and takes staffing jobs over a local
+Unix socket, so small changes don't have to wait for a browser to start
+and log in every time.
+
+Start it with:
+
+    edx_replace_staff --serve /tmp/edx_staff.sock
+
+Jobs are one line of JSON, sent to the socket. Any one of these:
+
+    {"csv": "Course,URL,Add,Promote,Remove,Demote\\n..."}
+    {"changes": [{"url": "...", "action": "Add", "email": "..."}, ...]}
+    {"list": ["https://studio.edx.org/course_team/...", ...]}
+
+The server answers with one line of JSON per message: first
+{"queued": job id, "position": jobs ahead of it}, then one line per course
+as it's finished, then {"done": true, ...} with totals. Anything that goes
+wrong comes back as {"error": "..."}.
+
+Submit a CSV from the command line with:
+
+    edx_replace_staff --submit /tmp/edx_staff.sock /path/to/input/csv
+"""
+
+from __future__ import annotations
+
+import io
+import os
+import csv
+import json
+import queue
+import stat
+import signal
+import socket
+import logging
+import itertools
+import threading
+import socketserver
+from edx_replace_staff.api import (
+    StaffChange,
+    changesFromRows,
+    rowsFromChanges,
+    courseResults,
+)
+
+logger = logging.getLogger(__name__)
+
+# How often to check on the browsers when there's nothing to do, in seconds.
+keepalive_seconds = 300
+
+
+class StaffingJob:
+    """One job from a client, plus a queue of messages to send back."""
+
+    job_ids = itertools.count(1)
+
+    def __init__(self, rows: list[dict], list_only: bool = False):
+        self.id = next(StaffingJob.job_ids)
+        self.rows = rows
+        self.list_only = list_only
+        self.messages = queue.Queue()
+
+
+def parseJob(request: dict) -> StaffingJob:
+    """
+    Turns a client's request into a StaffingJob.
+    Raises ValueError if the request doesn't make sense.
+    """
+    if not isinstance(request, dict):
+        raise ValueError("A job has to be a JSON object.")
+
+    if "csv" in request:
+        if not isinstance(request["csv"], str):
+            raise ValueError('"csv" has to be a string.')
+        reader = csv.DictReader(io.StringIO(request["csv"]))
+        if "URL" not in (reader.fieldnames or []):
+            raise ValueError("CSV has no URL column.")
+        # Going through StaffChange checks every action and deadline up front.
+        changes = changesFromRows(list(reader))
+    elif "changes" in request:
+        if not isinstance(request["changes"], list) or not all(
+            isinstance(c, dict) for c in request["changes"]
+        ):
+            raise ValueError('"changes" has to be a list of objects.')
+        try:
+            changes = [StaffChange(**c) for c in request["changes"]]
+        except TypeError as e:
+            raise ValueError("Bad change: " + str(e))
+    elif "list" in request:
+        if not isinstance(request["list"], list) or not all(
+            isinstance(url, str) for url in request["list"]
+        ):
+            raise ValueError('"list" has to be a list of URLs.')
+        return StaffingJob([{"Course": "", "URL": url} for url in request["list"]], True)
+    else:
+        raise ValueError('Send "csv", "changes", or "list".')
+
+    return StaffingJob(rowsFromChanges(changes))
+
+
+def runJobs(session, jobs: queue.Queue, stopping: threading.Event) -> None:
+    """
+    Works through jobs one at a time with the session's browsers, until
+    `stopping` is set. Meant to run in its own thread.
+    """
+    while not stopping.is_set():
+        try:
+            job = jobs.get(timeout=keepalive_seconds)
+        except queue.Empty:
+            if stopping.is_set():
+                return
+            # Nothing to do. Make sure the browsers are still up for next time.
+            try:
+                with session.lock:
+                    if len(session.drivers) > 0:
+                        session.start(len(session.drivers))
+            except RuntimeError as e:
+                logger.error("Keepalive failed: " + str(e))
+            continue
+
+        logger.info("Starting job " + str(job.id))
+        totals = {}
+        # Courses get finished by several worker threads at once.
+        totals_lock = threading.Lock()
+
+        def sendCourse(row, outcome):
+            message = {
+                "job": job.id,
+                "course": row.get("Course", ""),
+                "url": row["URL"],
+                "status": outcome["status"],
+            }
+            if job.list_only:
+                users = outcome.get("users", {"admin": [], "staff": []})
+                message["admin"] = users["admin"]
+                message["staff"] = users["staff"]
+            else:
+                message["results"] = courseResults(row, outcome)
+                with totals_lock:
+                    for result in message["results"]:
+                        totals[result["Result"]] = totals.get(result["Result"], 0) + 1
+            job.messages.put(message)
+
+        try:
+            session.runRows(job.rows, job.list_only, on_course=sendCourse)
+            job.messages.put({"job": job.id, "done": True, "totals": totals})
+        except Exception as e:
+            logger.error("Job " + str(job.id) + " failed: " + repr(e))
+            job.messages.put({"job": job.id, "error": str(e)})
+        finally:
+            # A None tells the connection there's nothing more coming.
+            job.messages.put(None)
+        logger.info("Finished job " + str(job.id))
+
+
+class StaffingRequestHandler(socketserver.StreamRequestHandler):
+    """Reads one job from a client and streams the results back."""
+
+    def send(self, message: dict) -> None:
+        self.wfile.write((json.dumps(message) + "\n").encode("utf-8"))
+        self.wfile.flush()
+
+    def handle(self):
+        line = self.rfile.readline()
+        try:
+            job = parseJob(json.loads(line))
+        except (ValueError, KeyError, TypeError) as e:
+            # json.JSONDecodeError is a ValueError too.
+            self.send({"error": str(e)})
+            return
+
+        self.send({"queued": job.id, "position": self.server.jobs.qsize()})
+        self.server.jobs.put(job)
+
+        while True:
+            message = job.messages.get()
+            if message is None:
+                return
+            try:
+                self.send(message)
+            except OSError:
+                # The client went away. The job still finishes.
+                logger.warning("Lost connection for job " + str(job.id))
+                return
+
+
+class StaffingServer(socketserver.ThreadingMixIn, socketserver.UnixStreamServer):
+    daemon_threads = True
+
+
+def serve(session, socket_path: str) -> None:
+    """
+    Starts the browsers and takes jobs on a Unix socket until interrupted.
+
+    Parameters:
+    session (StaffingSession): The session to run jobs with.
+    socket_path (str): Where to put the socket.
+    """
+    # Clear out a socket left behind by a server that's no longer running.
+    # Anything else at that path is somebody's file, so leave it alone.
+    if os.path.lexists(socket_path):
+        if not stat.S_ISSOCK(os.lstat(socket_path).st_mode):
+            raise RuntimeError(socket_path + " already exists and isn't a socket.")
+        try:
+            with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as probe:
+                probe.connect(socket_path)
+            raise RuntimeError("Something is already listening on " + socket_path)
+        except ConnectionRefusedError:
+            os.remove(socket_path)
+
+    # Treat a plain `kill` like control-C, so we clean up either way.
+    def stop(signum, frame):
+        raise KeyboardInterrupt
+
+    # Warm up the browsers before taking any jobs.
+    session.start()
+
+    server = None
+    bound = None
+    stopping = threading.Event()
+    old_handler = None
+    try:
+        # We've got a signed-in browser behind this. Only we get to use it.
+        old_umask = os.umask(0o177)
+        try:
+            server = StaffingServer(socket_path, StaffingRequestHandler)
+        finally:
+            os.umask(old_umask)
+        # Remember which file is ours, so we only ever clean up our own socket.
+        info = os.lstat(socket_path)
+        bound = (info.st_dev, info.st_ino)
+        server.jobs = queue.Queue()
+        threading.Thread(
+            target=runJobs, args=(session, server.jobs, stopping), daemon=True
+        ).start()
+
+        # Only the main thread is allowed to handle signals.
+        if threading.current_thread() is threading.main_thread():
+            old_handler = signal.signal(signal.SIGTERM, stop)
+
+        logger.info("Listening on " + socket_path)
+        server.serve_forever()
+    except KeyboardInterrupt:
+        logger.info("Shutting down.")
+    finally:
+        # Keep the job thread from starting browsers back up after we close them.
+        stopping.set()
+        if old_handler is not None:
+            signal.signal(signal.SIGTERM, old_handler)
+        if server is not None:
+            server.server_close()
+        removeOwnSocket(socket_path, bound)
+        session.close()
+
+
+def removeOwnSocket(socket_path: str, bound: tuple | None) -> None:
+    """
+    Deletes the socket we made, unless something else has taken its place.
+
+    Parameters:
+    socket_path (str): Where the socket is.
+    bound (tuple): The (device, inode) of the socket when we made it,
+        or None if we never got that far.
+    """
+    if bound is None:
+        return
+    try:
+        info = os.lstat(socket_path)
+    except FileNotFoundError:
+        return
+    if stat.S_ISSOCK(info.st_mode) and (info.st_dev, info.st_ino) == bound:
+        os.remove(socket_path)
+
+
+def submitJob(socket_path: str, request: dict):
+    """
+    Sends a job to a running server and yields each message that comes back.
+    """
+    with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as client:
+        client.connect(socket_path)
+        client.sendall((json.dumps(request) + "\n").encode("utf-8"))
+        with client.makefile("r", encoding="utf-8") as replies:
+            for line in replies:
+                yield json.loads(line)
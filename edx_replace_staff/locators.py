@@ -0,0 +1,62 @@
+"""
+Every locator the browser code uses, in one place.
+
+Each one is a (By, selector) tuple, so it can go straight into
+driver.find_elements(*locator) or an expected_conditions call.
+When edX changes their pages, this should be the only file to edit.
+
+Locators whose names start with "row_" are relative to a single
+team member's row, and should be looked up with row.find_elements()
+rather than driver.find_elements(). That keeps the browser from
+searching the whole page once for every e-mail address.
+"""
+
+from selenium.webdriver.common.by import By
+
+# Sign-in page
+login_page = "https://authn.edx.org/login"
+# If a page sends us here, our login has expired.
+login_host = "authn.edx.org"
+username_input = (By.CSS_SELECTOR, "#emailOrUsername")
+password_input = (By.CSS_SELECTOR, "#password")
+login_button = (By.CSS_SELECTOR, "#sign-in")
+login_failure_alert = (By.CSS_SELECTOR, "#login-failure-alert")
+password_reset_notice = (By.CSS_SELECTOR, "#password-security-reset-password")
+
+# Studio home
+studio_home_page = "https://studio.edx.org/home"
+studio_search_field = (By.ID, "pgn-searchfield-input-1")
+
+# Course Team page, whole-page locators
+user_email_input = (By.CSS_SELECTOR, "input#user-email-input")
+new_team_member_button = (By.XPATH, "//button[text()='New team member']")
+new_staff_email_input = (By.XPATH, "//input[@name='email']")
+add_user_button = (By.XPATH, "//button[text()='Add user']")
+error_dialog_ok_button = (
+    By.CSS_SELECTOR,
+    "div[aria-label='Error adding user'] button",
+)
+confirm_removal_button = (
+    By.XPATH,
+    "//div[contains(@aria-label, 'Delete course team member')]//button[text()='Delete']",
+)
+
+# Course Team page, one team member's row.
+# These are plain CSS strings because the row scan runs them in-page.
+member_row_css = "div.course-team-member"
+member_email_link_css = "div.member-info a"
+member_badge_css = "span.badge-current-user"
+
+# Course Team page, relative to a member's row.
+row_promote_button = (
+    By.XPATH,
+    ".//div[contains(@class, 'member-actions')]//button[contains(text(), 'Add admin access')]",
+)
+row_demote_button = (
+    By.XPATH,
+    ".//div[contains(@class, 'member-actions')]//button[contains(text(), 'Remove admin access')]",
+)
+row_delete_button = (
+    By.CSS_SELECTOR,
+    "div.member-actions button[data-testid='delete-button']",
+)
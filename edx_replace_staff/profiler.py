@@ -0,0 +1,207 @@
+"""
+Keeps an eye on memory use and page-load times during long runs, and
+says when a browser has gotten bad enough that it should be swapped for
+a fresh one.
+
+Turned on with --profile. Every course gets a line in the timeline file
+(profile_timeline.csv by default), so you can see whether a run is
+slowing down and why.
+
+Process sizes come from `ps`, so they're available on Mac and Linux.
+Browser sizes are only known for local browsers, not ones on a grid.
+"""
+
+from __future__ import annotations
+
+import os
+import csv
+import datetime
+import logging
+import subprocess
+import threading
+
+logger = logging.getLogger(__name__)
+
+default_timeline_file = "profile_timeline.csv"
+
+# How many page loads to average when deciding whether things have slowed down.
+page_window = 10
+
+# If we couldn't start a replacement browser, how many more courses to
+# keep using the old one before trying again.
+retry_pages = 25
+
+timeline_fields = [
+    "Time",
+    "Session",
+    "URL",
+    "Status",
+    "PageSeconds",
+    "PythonMB",
+    "BrowserMB",
+    "WindowHandles",
+    "PagesThisBrowser",
+    "Recycled",
+]
+
+
+def processTable() -> dict | None:
+    """
+    Returns {pid: (parent pid, RSS in KB)} for every running process,
+    or None if `ps` isn't available.
+    """
+    try:
+        output = subprocess.run(
+            ["ps", "-A", "-o", "pid=,ppid=,rss="],
+            capture_output=True,
+            text=True,
+            timeout=10,
+        ).stdout
+    except (OSError, subprocess.SubprocessError) as e:
+        logger.debug("Couldn't run ps: " + str(e))
+        return None
+
+    table = {}
+    for line in output.splitlines():
+        parts = line.split()
+        if len(parts) == 3 and all(p.isdigit() for p in parts):
+            table[int(parts[0])] = (int(parts[1]), int(parts[2]))
+    return table
+
+
+def treeRSS(table: dict, root_pid: int) -> int:
+    """Adds up the RSS, in KB, of a process and everything it started."""
+    children = {}
+    for pid, (ppid, rss) in table.items():
+        children.setdefault(ppid, []).append(pid)
+
+    total = 0
+    to_visit = [root_pid]
+    while len(to_visit) > 0:
+        pid = to_visit.pop()
+        if pid in table:
+            total += table[pid][1]
+        to_visit.extend(children.get(pid, []))
+    return total
+
+
+def driverPid(driver) -> int | None:
+    """The process ID of a local webdriver, or None for remote ones."""
+    service = getattr(driver, "service", None)
+    process = getattr(service, "process", None)
+    return getattr(process, "pid", None)
+
+
+class ResourceProfiler:
+    """
+    Samples resource use after each course and decides when to recycle
+    a browser. Safe to share between worker threads.
+
+    Parameters:
+    timeline_path (str): CSV file to write samples to. Overwritten.
+    max_pages (int): Recycle a browser after this many course pages. 0 for never.
+    max_browser_mb (float): Recycle a browser once it (and its child
+        processes) use this much memory. 0 for never.
+    max_slowdown (float): Recycle a browser once its recent page loads take
+        this many times longer than its first ones. 0 for never.
+    """
+
+    def __init__(
+        self,
+        timeline_path: str = default_timeline_file,
+        max_pages: int = 250,
+        max_browser_mb: float = 2048,
+        max_slowdown: float = 3.0,
+    ):
+        self.timeline_path = timeline_path
+        self.max_pages = max_pages
+        self.max_browser_mb = max_browser_mb
+        self.max_slowdown = max_slowdown
+        self.lock = threading.Lock()
+        # Page counts and page-load times for each browser.
+        self.browsers = {}
+
+        with open(self.timeline_path, "w", newline="") as f:
+            csv.DictWriter(f, fieldnames=timeline_fields).writeheader()
+
+    def forget(self, driver) -> None:
+        """Drops what we know about a browser that's been shut down."""
+        with self.lock:
+            self.browsers.pop(id(driver), None)
+
+    def postpone(self, driver) -> None:
+        """
+        Holds off on recycling a browser for retry_pages more courses.
+        For when we tried and couldn't start a replacement, so we don't
+        try again (and fail again) after every single course.
+        """
+        with self.lock:
+            state = self.browsers.setdefault(id(driver), {"pages": 0, "page_times": []})
+            state["retry_at"] = state["pages"] + retry_pages
+
+    def recycleReason(self, state: dict, browser_mb: float | None) -> str | None:
+        """Returns why a browser should be recycled, or None if it's fine."""
+        if state["pages"] < state.get("retry_at", 0):
+            return None
+        if self.max_pages and state["pages"] >= self.max_pages:
+            return "pages"
+        if self.max_browser_mb and browser_mb and browser_mb >= self.max_browser_mb:
+            return "memory"
+        times = state["page_times"]
+        if self.max_slowdown and len(times) >= page_window * 2:
+            first = sum(times[:page_window]) / page_window
+            recent = sum(times[-page_window:]) / page_window
+            if first > 0 and recent / first >= self.max_slowdown:
+                return "slowdown"
+        return None
+
+    def sample(self, session_number: int, driver, row: dict, outcome: dict) -> str | None:
+        """
+        Records how things look after a course, and writes it to the timeline.
+        Returns why the browser should be recycled, or None if it's fine.
+        """
+        page_seconds = (outcome.get("timings") or {}).get("Page")
+
+        table = processTable()
+        python_mb = None
+        browser_mb = None
+        if table is not None:
+            python_mb = table.get(os.getpid(), (0, 0))[1] / 1024
+            pid = driverPid(driver)
+            if pid is not None:
+                browser_mb = treeRSS(table, pid) / 1024
+
+        try:
+            handles = len(driver.window_handles)
+        except Exception:
+            handles = None
+
+        with self.lock:
+            state = self.browsers.setdefault(id(driver), {"pages": 0, "page_times": []})
+            state["pages"] += 1
+            if page_seconds is not None:
+                state["page_times"].append(page_seconds)
+            reason = self.recycleReason(state, browser_mb)
+
+            with open(self.timeline_path, "a", newline="") as f:
+                csv.DictWriter(f, fieldnames=timeline_fields).writerow(
+                    {
+                        "Time": datetime.datetime.now().isoformat(timespec="seconds"),
+                        "Session": session_number,
+                        "URL": row["URL"],
+                        "Status": outcome["status"],
+                        "PageSeconds": roundOrBlank(page_seconds, 2),
+                        "PythonMB": roundOrBlank(python_mb, 1),
+                        "BrowserMB": roundOrBlank(browser_mb, 1),
+                        "WindowHandles": "" if handles is None else handles,
+                        "PagesThisBrowser": state["pages"],
+                        "Recycled": reason or "",
+                    }
+                )
+
+        return reason
+
+
+def roundOrBlank(value: float | None, digits: int):
+    """Rounds a number for the timeline, or leaves the cell blank."""
+    return "" if value is None else round(value, digits)
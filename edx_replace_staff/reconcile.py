@@ -0,0 +1,138 @@
+"""
+Works out what changes are needed to make courses match a master roster.
+
+The roster says who should be admin and staff where. The snapshot is
+what --list found last time (course_staffing.csv). Comparing the two is
+just set arithmetic on each course's e-mail addresses, so it takes a
+moment even for thousands of courses, and only courses that actually
+need changes end up in the output.
+
+The roster can be either of these:
+
+    Course,URL,Admin,Staff             (like course_staffing.csv,
+                                        space-separated addresses)
+    Course,URL,Email,Role              (one person per line,
+                                        Role is Admin or Staff)
+
+Nothing in here touches a browser.
+"""
+
+import csv
+from edx_replace_staff.scheduler import action_columns, splitEmails
+
+reconcile_file = "reconcile_actions.csv"
+
+
+def normalizeURL(url: str) -> str:
+    """Lets the same course match even with stray spaces or a trailing slash."""
+    return url.strip().rstrip("/")
+
+
+def readStaffing(path: str) -> dict:
+    """
+    Reads a roster or snapshot file.
+
+    Returns {url: {"Course": name, "URL": url, "admin": set, "staff": set}}.
+    Addresses are lowercased. Anyone listed as both admin and staff counts
+    as admin. Raises ValueError if the file isn't in either format.
+    """
+    courses = {}
+    with open(path, "r", newline="") as file:
+        reader = csv.DictReader(file)
+        headers = reader.fieldnames or []
+        one_per_line = "Email" in headers and "Role" in headers
+        if "URL" not in headers or not (
+            one_per_line or ("Admin" in headers and "Staff" in headers)
+        ):
+            raise ValueError(
+                path + " needs URL and either Admin and Staff, or Email and Role columns."
+            )
+
+        # Line 1 is the header.
+        for line_number, row in enumerate(reader, start=2):
+            url = normalizeURL(row["URL"] or "")
+            if url == "":
+                continue
+            course = courses.setdefault(
+                url,
+                {"Course": row.get("Course") or "", "URL": url, "admin": set(), "staff": set()},
+            )
+
+            if one_per_line:
+                role = (row["Role"] or "").strip().lower()
+                if role not in ["admin", "staff"]:
+                    raise ValueError(
+                        path + ", line " + str(line_number) + ": unknown role " + repr(row["Role"])
+                    )
+                course[role].update(e.lower() for e in splitEmails(row["Email"]))
+            else:
+                course["admin"].update(e.lower() for e in splitEmails(row["Admin"]))
+                course["staff"].update(e.lower() for e in splitEmails(row["Staff"]))
+
+    for course in courses.values():
+        course["staff"] -= course["admin"]
+    return courses
+
+
+def reconcile(desired: dict, current: dict, keep: set = frozenset()) -> list[dict]:
+    """
+    Compares the roster with the snapshot, course by course.
+
+    Parameters:
+    desired (dict): From readStaffing(), who should be where.
+    current (dict): From readStaffing(), who was there last time we looked.
+    keep (set): Addresses never to remove or demote, like the account
+        the script signs in with.
+
+    Returns CSV-style rows with Course, URL, and the action columns, one
+    for each course that needs changes. Courses that aren't in the roster
+    are left alone. Courses that aren't in the snapshot get everyone on
+    the roster added and promoted, since we don't know who's there; the
+    staffing functions skip anyone who's already set.
+    """
+    keep = {e.lower() for e in keep}
+    rows = []
+
+    for url, wanted in desired.items():
+        want_admin = wanted["admin"]
+        want_all = want_admin | wanted["staff"]
+
+        found = current.get(url)
+        have_admin = found["admin"] if found else set()
+        have_all = (have_admin | found["staff"]) if found else set()
+
+        changes = {
+            "Add": want_all - have_all,
+            "Promote": want_admin - have_admin,
+            # Admins have to be demoted before they can be removed, so this
+            # includes admins who are leaving altogether.
+            "Demote": (have_admin - want_admin) - keep,
+            "Remove": (have_all - want_all) - keep,
+        }
+        if not any(changes.values()):
+            continue
+
+        row = {"Course": wanted["Course"] or (found or {}).get("Course", ""), "URL": url}
+        for column in action_columns:
+            row[column] = " ".join(sorted(changes[column]))
+        rows.append(row)
+
+    return rows
+
+
+def writeActions(rows: list[dict], path: str = reconcile_file) -> None:
+    """Writes the changes out as an input CSV for this script."""
+    with open(path, "w", newline="") as file:
+        writer = csv.DictWriter(file, fieldnames=["Course", "URL"] + action_columns)
+        writer.writeheader()
+        for row in rows:
+            writer.writerow(row)
+
+
+def summarize(rows: list[dict]) -> str:
+    """A one-line count of the changes, for the log."""
+    counts = [
+        str(sum(len(splitEmails(row[column])) for row in rows)) + " " + column.lower()
+        for column in action_columns
+    ]
+    return str(len(rows)) + " courses need changes: " + ", ".join(counts) + "."
@@ -0,0 +1,145 @@
+"""
+Decides what order the courses get worked on, and keeps track of how
+long things are taking so we can say when we'll be done.
+
+Nothing in here touches a browser, so it's cheap to import.
+"""
+
+from __future__ import annotations
+
+import datetime
+import threading
+
+# The columns we need in order to make changes.
+action_columns = ["Add", "Promote", "Remove", "Demote"]
+
+# Lower numbers go first. Getting someone out of a course is more urgent
+# than letting someone new in.
+priority_classes = {"Remove": 0, "Demote": 1, "Promote": 2, "Add": 3}
+no_action_priority = len(priority_classes)
+
+# What we guess an action takes before we've timed any, in seconds.
+default_seconds = {"Page": 5.0, "Add": 5.0, "Promote": 3.0, "Demote": 3.0, "Remove": 4.0}
+
+
+def splitEmails(cell: str) -> list[str]:
+    """Splits a space-separated cell of e-mail addresses into a list."""
+    if cell is None:
+        return []
+    # Split e-mail list on spaces and throw out blank elements.
+    return [x.strip() for x in cell.split(" ") if x.strip() != ""]
+
+
+def parseDeadline(value: str) -> datetime.datetime | None:
+    """
+    Reads a deadline like "2024-05-01" or "2024-05-01 17:00".
+    Returns a naive local datetime, or None for a blank cell.
+    Raises ValueError if it can't be read.
+    """
+    if value is None or value.strip() == "":
+        return None
+    deadline = datetime.datetime.fromisoformat(value.strip())
+    if deadline.tzinfo is not None:
+        deadline = deadline.astimezone().replace(tzinfo=None)
+    return deadline
+
+
+def rowPriority(row: dict) -> int:
+    """Returns the priority class of the most urgent change in a CSV row."""
+    classes = [
+        priority_classes[column]
+        for column in action_columns
+        if len(splitEmails(row.get(column))) > 0
+    ]
+    return min(classes, default=no_action_priority)
+
+
+def scheduleKey(row: dict, index: int) -> tuple:
+    """
+    The sort key for one CSV row: priority class first, then deadline
+    (rows without one go after rows with one), then the order in the file.
+    The index keeps keys unique, so rows themselves never get compared.
+    """
+    deadline = parseDeadline(row.get("Deadline"))
+    return (
+        rowPriority(row),
+        deadline is None,
+        deadline or datetime.datetime.max,
+        index,
+    )
+
+
+class ProgressTracker:
+    """
+    Keeps count of the work left to do and how long each kind of action
+    has been taking, and estimates how much longer the run will take.
+    Safe to share between worker threads.
+    """
+
+    def __init__(self, workers: int = 1):
+        self.workers = max(workers, 1)
+        self.lock = threading.Lock()
+        self.rows_total = 0
+        self.rows_done = 0
+        # Actions still to do, by type. "Page" counts course pages to open.
+        self.pending = {key: 0 for key in default_seconds}
+        # Total seconds and number of timed actions, by type.
+        self.seconds = {key: 0.0 for key in default_seconds}
+        self.counts = {key: 0 for key in default_seconds}
+
+    def rowCounts(self, row: dict) -> dict:
+        """How many of each action a row needs, plus one page load."""
+        counts = {column: len(splitEmails(row.get(column))) for column in action_columns}
+        counts["Page"] = 1
+        return counts
+
+    def addRow(self, row: dict) -> None:
+        """Counts a row that's been queued."""
+        with self.lock:
+            self.rows_total += 1
+            for key, count in self.rowCounts(row).items():
+                self.pending[key] += count
+
+    def finishRow(self, row: dict, timings: dict | None = None) -> None:
+        """
+        Counts a row as finished, whether or not it worked.
+
+        Parameters:
+        row (dict): The CSV row.
+        timings (dict): Seconds spent, by action type ("Page", "Add", etc.),
+            for the parts that actually ran. None if nothing was timed.
+        """
+        with self.lock:
+            self.rows_done += 1
+            counts = self.rowCounts(row)
+            for key, count in counts.items():
+                self.pending[key] -= count
+            for key, seconds in (timings or {}).items():
+                if counts.get(key, 0) > 0:
+                    self.seconds[key] += seconds
+                    self.counts[key] += counts[key]
+
+    def averageSeconds(self, key: str) -> float:
+        """The average time for one action of this type so far."""
+        if self.counts[key] == 0:
+            return default_seconds[key]
+        return self.seconds[key] / self.counts[key]
+
+    def eta(self) -> datetime.timedelta:
+        """Estimated time left, spread across all the workers."""
+        with self.lock:
+            total = sum(
+                self.pending[key] * self.averageSeconds(key) for key in self.pending
+            )
+        return datetime.timedelta(seconds=round(total / self.workers))
+
+    def summary(self) -> str:
+        """A one-line progress report for the log."""
+        return (
+            str(self.rows_done)
+            + "/"
+            + str(self.rows_total)
+            + " courses done, about "
+            + str(self.eta())
+            + " left."
+        )
@@ -71,6 +71,7 @@ setup(
     ],
     include_package_data=True,
     install_requires=requirements,
+    python_requires=">=3.9",
     zip_safe=False,
     keywords="hx edx staff " + project_name,
     classifiers=[
@@ -78,8 +79,9 @@ setup(
         "Intended Audience :: Developers",
         "Natural Language :: English",
         "Programming Language :: Python :: 3",
-        "Programming Language :: Python :: 3.6",
-        "Programming Language :: Python :: 3.8",
+        "Programming Language :: Python :: 3.9",
+        "Programming Language :: Python :: 3.10",
+        "Programming Language :: Python :: 3.11",
     ],
     test_suite="tests",
     tests_require=test_requirements,
@@ -0,0 +1,98 @@
+"""
+Checks the changes worked out from a roster and a snapshot. These decide
+who loses access to real courses, so they're worth being sure of.
+"""
+
+import os
+import tempfile
+import unittest
+from edx_replace_staff import reconcile
+
+
+def course(admin: str = "", staff: str = "", name: str = "Course") -> dict:
+    """A course the way readStaffing() returns it."""
+    return {
+        "Course": name,
+        "URL": "",
+        "admin": set(admin.split()),
+        "staff": set(staff.split()),
+    }
+
+
+class ReconcileTest(unittest.TestCase):
+    def test_set_differences(self):
+        desired = {
+            "u": course(
+                admin="boss@x.org promoted@x.org",
+                staff="new@x.org stays@x.org demoted@x.org",
+            )
+        }
+        current = {
+            "u": course(
+                admin="boss@x.org demoted@x.org leaving_admin@x.org",
+                staff="stays@x.org promoted@x.org gone@x.org",
+            )
+        }
+
+        rows = reconcile.reconcile(desired, current)
+        self.assertEqual(len(rows), 1)
+        row = rows[0]
+        self.assertEqual(row["Add"], "new@x.org")
+        self.assertEqual(row["Promote"], "promoted@x.org")
+        # Admins who are leaving get demoted as well as removed.
+        self.assertEqual(row["Demote"], "demoted@x.org leaving_admin@x.org")
+        self.assertEqual(row["Remove"], "gone@x.org leaving_admin@x.org")
+
+    def test_no_changes_no_row(self):
+        desired = {"u": course(admin="a@x.org", staff="b@x.org")}
+        current = {"u": course(admin="a@x.org", staff="b@x.org")}
+        self.assertEqual(reconcile.reconcile(desired, current), [])
+
+    def test_keep(self):
+        desired = {"u": course(admin="boss@x.org")}
+        current = {"u": course(admin="boss@x.org me@x.org", staff="friend@x.org")}
+        rows = reconcile.reconcile(desired, current, {"ME@x.org", "friend@x.org"})
+        self.assertEqual(rows, [])
+
+    def test_missing_from_snapshot(self):
+        desired = {"u": course(admin="boss@x.org", staff="a@x.org", name="New")}
+        rows = reconcile.reconcile(desired, {})
+        self.assertEqual(
+            rows,
+            [
+                {
+                    "Course": "New",
+                    "URL": "u",
+                    "Add": "a@x.org boss@x.org",
+                    "Promote": "boss@x.org",
+                    "Remove": "",
+                    "Demote": "",
+                }
+            ],
+        )
+
+    def test_missing_from_roster(self):
+        current = {"u": course(admin="boss@x.org", staff="a@x.org")}
+        self.assertEqual(reconcile.reconcile({}, current), [])
+
+    def test_trailing_slash(self):
+        with tempfile.TemporaryDirectory() as folder:
+            roster_path = os.path.join(folder, "roster.csv")
+            with open(roster_path, "w") as f:
+                f.write("Course,URL,Email,Role\n")
+                f.write("A,https://studio.edx.org/course_team/A/ ,Boss@x.org,Admin\n")
+                f.write("A,https://studio.edx.org/course_team/A/ ,a@x.org,Staff\n")
+            snapshot_path = os.path.join(folder, "snapshot.csv")
+            with open(snapshot_path, "w") as f:
+                f.write("Course,URL,Admin,Staff\n")
+                f.write("A,https://studio.edx.org/course_team/A,boss@x.org,a@x.org\n")
+
+            desired = reconcile.readStaffing(roster_path)
+            current = reconcile.readStaffing(snapshot_path)
+
+        self.assertEqual(list(desired), ["https://studio.edx.org/course_team/A"])
+        self.assertEqual(reconcile.reconcile(desired, current), [])
+
+
+if __name__ == "__main__":
+    unittest.main()
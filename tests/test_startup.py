@@ -0,0 +1,39 @@
+"""
+Makes sure the command line can start without loading Selenium, so that
+--help, --validate, and the other offline commands stay fast.
+"""
+
+import sys
+import subprocess
+import unittest
+
+# Runs in a fresh interpreter, so nothing this test process has already
+# imported gets in the way.
+check_script = """
+import sys
+import edx_replace_staff.ReplaceEdXStaff as cli
+hasattr(cli, "__all__")
+from edx_replace_staff.ReplaceEdXStaff import *
+print(" ".join(m for m in sys.modules if m.split(".")[0] == "selenium"))
+"""
+
+
+class StartupTest(unittest.TestCase):
+    def test_no_selenium_on_import(self):
+        result = subprocess.run(
+            [sys.executable, "-c", check_script],
+            capture_output=True,
+            text=True,
+        )
+        self.assertEqual(result.returncode, 0, result.stderr)
+        self.assertEqual(result.stdout.strip(), "", "Selenium was loaded at startup.")
+
+    def test_unknown_names_are_missing(self):
+        import edx_replace_staff.ReplaceEdXStaff as cli
+
+        with self.assertRaises(AttributeError):
+            cli.notAFunction
+
+
+if __name__ == "__main__":
+    unittest.main()